@@ -1,6 +1,8 @@
 import wx
 import os
+import appdirs
 import steamsync
+from steamsync.steameditor import SteamDatabase
 from io import StringIO
 import sys
 import tempfile
@@ -206,7 +208,10 @@ class MainFrame(wx.Frame):
 
         self.pnl = wx.Panel(self)
         self.steam_path = steam_path
-        self.users = steamsync.enumerate_steam_accounts(steam_path)
+        steamdb = SteamDatabase(
+            steam_path, None, False, appdirs.user_cache_dir("steamsync")
+        )
+        self.users = steamdb.enumerate_steam_accounts()
         self.user_radio = wx.RadioBox(
             self.pnl,
             id=wx.ID_ANY,
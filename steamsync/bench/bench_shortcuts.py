@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Compare our shortcuts.vdf reader and writer against the vdf module on a
+big shortcuts file.
+
+Runs anywhere: python -m bench.bench_shortcuts
+"""
+
+import timeit
+
+import vdf
+
+import steamsync.shortcuts as shortcuts
+
+
+def make_shortcuts(count):
+    """Make shortcuts shaped like the ones Steam and emulation front-ends
+    write.
+
+    make_shortcuts(int) -> dict
+    """
+    entries = {}
+    for i in range(count):
+        rom = f"/home/deck/Emulation/roms/snes/Game Number {i} (USA) (Rev 1).sfc"
+        entries[str(i)] = {
+            "appid": -(i + 1) * 7919,
+            "AppName": f"Game Number {i} – Édition spéciale",
+            "Exe": '"/usr/bin/flatpak"',
+            "StartDir": '"/usr/bin/"',
+            "icon": f"/home/deck/.steam/steam/userdata/1/config/grid/{i}_icon.png",
+            "ShortcutPath": "",
+            "LaunchOptions": f'run org.libretro.RetroArch -L snes9x_libretro.so "{rom}"',
+            "IsHidden": 0,
+            "AllowDesktopConfig": 1,
+            "AllowOverlay": 1,
+            "OpenVR": 0,
+            "Devkit": 0,
+            "DevkitGameID": "",
+            "DevkitOverrideAppID": 0,
+            "LastPlayTime": 1700000000 + i,
+            "FlatpakAppID": "",
+            "tags": {"0": "SNES", "1": "Emulation"},
+        }
+    return {"shortcuts": entries}
+
+
+def benchmark(count=10000):
+    """Compare against the vdf module on a big shortcuts file.
+
+    benchmark(int) -> None
+    """
+    data = vdf.binary_dumps(make_shortcuts(count))
+    print(f"{count} shortcuts, {len(data) / 1024:.0f} KiB")
+
+    loaded = shortcuts.loads(data)
+    assert loaded == vdf.binary_loads(data), "Loaded different shortcuts than vdf"
+    assert shortcuts.dumps(loaded) == data, "Round trip changed the file"
+    # Bytes that aren't valid utf-8 must survive a round trip too.
+    broken = data.replace(b"Game Number 0 (USA)", b"Game Number 0 \xff(USA)")
+    assert shortcuts.dumps(shortcuts.loads(broken)) == broken, "Round trip changed invalid utf-8"
+
+    contenders = {
+        "vdf load": lambda: vdf.binary_loads(data),
+        "our load": lambda: shortcuts.loads(data),
+        "vdf dump": lambda: vdf.binary_dumps(loaded),
+        "our dump": lambda: shortcuts.dumps(loaded),
+    }
+    for label, fn in contenders.items():
+        seconds = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{label:>10}: {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Compare the xbox launcher's streaming manifest parsers against the
+minidom ones they replaced, and against reading from the manifest cache.
+
+Runs anywhere: python -m bench.bench_xbox
+"""
+
+import contextlib
+import io
+import json
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from xml.dom import minidom
+
+import steamsync.launchers.xbox as xbox
+
+
+def write_manifests(folder, count):
+    """Write MicrosoftGame.config and AppxManifest.xml files shaped like the
+    ones real packages install: the fields we need near the top, followed by
+    lots of resources, capabilities, and extension registrations.
+
+    write_manifests(Path, int) -> list[(Path, Path)]
+    """
+    languages = "".join(
+        f'    <Resource Language="{lang}-{region}" />\n'
+        for lang in ["en", "fr", "de", "es", "it", "ja", "ko", "pt", "ru", "zh"]
+        for region in ["US", "GB", "FR", "DE", "ES", "BR"]
+    )
+    packages = []
+    for i in range(count):
+        package = folder / f"Package{i}"
+        package.mkdir()
+        kind = i % 4
+        family = "Windows.Xbox" if kind == 3 else "Windows.Desktop"
+        display_name = "Xbox Console Companion" if kind == 2 else f"Game {i}"
+        game_dll = "UnityPlayer.dll" if kind == 0 else "Microsoft.Xbox.Services.dll"
+        classes = "".join(f"""        <InProcessServer>
+          <Path>Library{i}_{n}.dll</Path>
+          <ActivatableClass ActivatableClassId="Game{i}.Class{n}" ThreadingModel="both" />
+        </InProcessServer>
+""" for n in range(150))
+        manifest = f"""<?xml version="1.0" encoding="utf-8"?>
+<Package xmlns="http://schemas.microsoft.com/appx/manifest/foundation/windows10" xmlns:uap="http://schemas.microsoft.com/appx/manifest/uap/windows10">
+  <Identity Name="Publisher.Game{i}" Publisher="CN=Publisher" Version="1.0.{i}.0" ProcessorArchitecture="x64" />
+  <Properties>
+    <DisplayName>{display_name}</DisplayName>
+    <PublisherDisplayName>Publisher</PublisherDisplayName>
+    <Logo>Assets\\StoreLogo.png</Logo>
+  </Properties>
+  <Dependencies>
+    <TargetDeviceFamily Name="{family}" MinVersion="10.0.17763.0" MaxVersionTested="10.0.19041.0" />
+    <PackageDependency Name="Microsoft.VCLibs.140.00" MinVersion="14.0.0.0" Publisher="CN=Microsoft" />
+  </Dependencies>
+  <Resources>
+{languages}  </Resources>
+  <Applications>
+    <Application Id="App" Executable="Game{i}.exe" EntryPoint="Windows.FullTrustApplication">
+      <uap:VisualElements DisplayName="{display_name}" Description="Game {i}" Square150x150Logo="Assets\\Logo.png" Square44x44Logo="Assets\\SmallLogo.png" BackgroundColor="transparent" />
+    </Application>
+  </Applications>
+  <Capabilities>
+    <Capability Name="internetClient" />
+  </Capabilities>
+  <Extensions>
+    <Extension Category="windows.activatableClass.inProcessServer">
+{classes}        <InProcessServer>
+          <Path>{game_dll}</Path>
+          <ActivatableClass ActivatableClassId="Game{i}.Services" ThreadingModel="both" />
+        </InProcessServer>
+    </Extension>
+  </Extensions>
+</Package>
+"""
+        config = f"""<?xml version="1.0" encoding="utf-8"?>
+<Game configVersion="1">
+  <Identity Name="Publisher.Game{i}" Publisher="CN=Publisher" Version="1.0.{i}.0" />
+  <ExecutableList>
+    <Executable Name="Game{i}.exe" TargetDeviceFamily="PC" Id="Game" />
+  </ExecutableList>
+  <ShellVisuals DefaultDisplayName="Game® {i}" PublisherDisplayName="Publisher" StoreLogo="StoreLogo.png" Square150x150Logo="Logo.png" Square44x44Logo="SmallLogo.png" />
+  <Resources>
+{languages}  </Resources>
+  <DesktopRegistration>
+    <DependencyList>
+{"".join(f'      <KnownDependency Name="Dependency{n}" />{chr(10)}' for n in range(100))}    </DependencyList>
+  </DesktopRegistration>
+</Game>
+"""
+        (package / f"Game{i}.exe").write_bytes(b"MZ")
+        (package / "AppxManifest.xml").write_text(manifest, encoding="utf-8")
+        (package / "MicrosoftGame.config").write_text(config, encoding="utf-8")
+        packages.append(
+            (package / "MicrosoftGame.config", package / "AppxManifest.xml")
+        )
+    return packages
+
+
+def benchmark(count=300):
+    """Compare the streaming parsers against the minidom ones they replaced,
+    and against reading from the manifest cache.
+
+    benchmark(int) -> None
+    """
+
+    def get_details_from_config_with_minidom(path_to_config):
+        with path_to_config.open("r", encoding="utf-8") as f:
+            doc = minidom.parse(f)
+        display_name = doc.getElementsByTagName("ShellVisuals")[0].getAttribute(
+            "DefaultDisplayName"
+        )
+        for exe in doc.getElementsByTagName("Executable"):
+            return exe.getAttribute("Name"), display_name
+
+    def is_game_judging_by_manifest_with_minidom(path_to_manifest):
+        with path_to_manifest.open("r", encoding="utf-8", errors="ignore") as f:
+            doc = minidom.parse(f)
+        name = [
+            e.getAttribute("DisplayName").lower()
+            for e in doc.getElementsByTagName("uap:VisualElements")
+        ]
+        if any(e for e in name if "xbox" in e):
+            return None
+        family = [
+            e.getAttribute("Name").lower()
+            for e in doc.getElementsByTagName("TargetDeviceFamily")
+        ]
+        if "windows.desktop" not in family:
+            return None
+        libs = [e.firstChild.nodeValue for e in doc.getElementsByTagName("Path")]
+        if "Microsoft.Xbox.Services.dll" not in libs and "UnityPlayer.dll" not in libs:
+            return None
+        for exe in doc.getElementsByTagName("Application"):
+            exe_name = exe.getAttribute("Executable")
+            return exe_name and not exe_name.isspace()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        packages = write_manifests(tmp, count)
+        total_bytes = sum(
+            config.stat().st_size + manifest.stat().st_size
+            for config, manifest in packages
+        )
+        print(
+            f"{count} packages, {total_bytes / count / 1024:.0f} KiB of xml per package"
+        )
+
+        for config, manifest in packages:
+            assert xbox._get_details_from_config(
+                config
+            ) == get_details_from_config_with_minidom(config), config
+            assert xbox._is_game_judging_by_manifest(
+                manifest
+            ) == is_game_judging_by_manifest_with_minidom(manifest), manifest
+
+        def parse_all(get_details, is_game):
+            for config, manifest in packages:
+                get_details(config)
+                is_game(manifest)
+
+        cache = xbox._ManifestCache(tmp / "cache")
+        contenders = {
+            "minidom": lambda: parse_all(
+                get_details_from_config_with_minidom,
+                is_game_judging_by_manifest_with_minidom,
+            ),
+            "streaming": lambda: parse_all(
+                xbox._get_details_from_config, xbox._is_game_judging_by_manifest
+            ),
+            "cached": lambda: parse_all(
+                lambda p: cache.get(p, xbox._get_details_from_config),
+                lambda p: cache.get(p, xbox._is_game_judging_by_manifest),
+            ),
+        }
+        for label, fn in contenders.items():
+            seconds = min(timeit.repeat(fn, number=1, repeat=3))
+            print(f"{label:>10}: {seconds * 1000:8.1f} ms")
+
+        # The whole launcher, with packages from a file instead of PowerShell.
+        inventory_fname = tmp / "inventory.json"
+        with inventory_fname.open("w", encoding="utf-8") as f:
+            json.dump(
+                [
+                    {
+                        "Kind": "Game" if i % 2 else "App",
+                        "Appid": f"Publisher.Game{i}",
+                        "PrettyName": f"Game {i}",
+                        "Icon": str(config.parent / "SmallLogo.png"),
+                        "InstallLocation": str(config.parent),
+                        "Aumid": f"Publisher.Game{i}_abc!App",
+                    }
+                    for i, (config, manifest) in enumerate(packages)
+                ],
+                f,
+            )
+        launcher = xbox.XboxLauncher(
+            tmp / "launcher", xbox.FileInventory(inventory_fname)
+        )
+        for label in ["cold launcher", "warm launcher"]:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                games = launcher.collect_games()
+            seconds = time.perf_counter() - start
+            print(f"{label:>10}: {seconds * 1000:8.1f} ms ({len(games)} games)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,617 @@
+#! /usr/bin/env python
+
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+k_applist_db_fname = "applist.sqlite3"
+# Bump when the schema changes. An old database is rebuilt from scratch.
+k_schema_version = 5
+
+k_api_url = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+# Largest page GetAppList will return.
+k_page_size = 50000
+# Steam has a few hundred thousand apps, so this is plenty. Stops us from
+# looping forever if the api keeps telling us there's more.
+k_max_pages = 50
+k_http_timeout = 30
+# Most apps find_similar will score. Apps that share the most of the query's
+# rare trigrams for their length are scored first.
+k_max_similar_candidates = 200
+# Give up on a sync that takes longer than this, and keep what we had.
+k_sync_deadline = timedelta(minutes=5)
+# Fetch apps changed since the last sync after this long.
+k_refresh_age = timedelta(days=1)
+# Changes only tell us about apps that still exist, so every so often start
+# over to forget removed apps.
+k_rebuild_age = timedelta(days=30)
+# Ask for a little more than we need in case of clock differences.
+k_modified_since_slack = timedelta(hours=1)
+
+# Apps in a full catalogue. Above this, index names on several processes.
+k_parallel_index_threshold = 20000
+k_parallel_index_chunk = 10000
+
+# How a catalogue name was turned into an index key. Lower ranks are closer
+# to the original name and win when a query finds several.
+k_rank_exact = 0
+k_rank_canonical = 1
+k_rank_subtitle = 2
+
+re_remove_win10 = re.compile(r" win10\b")
+re_remove_subtitle = re.compile(r"\s*:.*")
+re_remove_braces = re.compile(r"\s*\(.*\)")
+re_remove_pc = re.compile(r"[ _](pc|for windows|windows)$")
+re_remove_edition = re.compile(r" (ultimate|digital|steam) edition$")
+
+_punctuation_table = str.maketrans("", "", ":;,.=+?")
+
+
+class _CombiningMarksTable(dict):
+    """
+    str.translate table that omits characters that would combine with the
+    previous one (diacritics). Filled in as we see new characters, since most
+    names only use a few.
+    See https://stackoverflow.com/a/517974/79125
+    """
+
+    def __missing__(self, codepoint):
+        value = None if unicodedata.combining(chr(codepoint)) else codepoint
+        self[codepoint] = value
+        return value
+
+
+_combining_marks_table = _CombiningMarksTable()
+
+
+def make_gamename_comparable(name):
+    """Convert a game name into something easier to compare. Does minimal
+    transformations to ensure the best matches, but removes irrelevant
+    details.
+
+    make_gamename_comparable(str) -> str
+    """
+    # Always remove hypen because it adds extra uncertainty.
+    # Ignore 'the' vs 'The' differences (fixes Into The Breach)
+    return name.replace("- ", "").lower()
+
+
+def get_canonical_key(name):
+    """Convert a game name into the key we index and look up names by.
+
+    Strips everything that store names commonly add or drop compared to
+    Steam's names. Catalogue names and queries both go through this, so
+    finding a name is one lookup instead of trying each variation.
+
+    get_canonical_key(str) -> str
+    """
+    return _get_canonical_key_of_comparable(make_gamename_comparable(name))
+
+
+def get_subtitle_key(name):
+    """Convert a game name into a canonical key without its subtitle.
+
+    get_subtitle_key(str) -> str
+    """
+    return _get_subtitle_key_of_comparable(make_gamename_comparable(name))
+
+
+def _get_canonical_key_of_comparable(name):
+    """get_canonical_key for a name from make_gamename_comparable.
+
+    Checks for each thing to strip before running its regex since most names
+    don't have any of them. This runs for every app in the catalogue.
+
+    _get_canonical_key_of_comparable(str) -> str
+    """
+    if "win10" in name:
+        # For: "Death's Door Win10" -> "Death's Door"
+        name = re_remove_win10.sub("", name, 1)
+    if "(" in name:
+        # For: "Yakuza Kiwami (PC)" -> "Yakuza Kiwami"
+        name = re_remove_braces.sub("", name, 1)
+    if name.endswith(("pc", "windows")):
+        # For: "Ghost of a Tale PC" -> "Ghost of a Tale"
+        # For: "Genesis Noir for Windows" -> "Genesis Noir"
+        name = re_remove_pc.sub("", name, 1)
+    if name.endswith(" edition"):
+        # For: "Control" -> "Control Ultimate Edition"
+        name = re_remove_edition.sub("", name, 1)
+    if not name.isascii():
+        # For: "ABZÛ" -> "ABZU"
+        name = unicodedata.normalize("NFKD", name).translate(_combining_marks_table)
+        # For: "Rocket League®" -> "Rocket League"
+        # Unless that leaves nothing, like for names that aren't in latin script.
+        ascii_name = name.encode("ascii", "ignore").decode()
+        if ascii_name.translate(_punctuation_table).strip():
+            name = ascii_name
+    # For: "Raji: An Ancient Epic" -> "Raji An Ancient Epic"
+    name = name.translate(_punctuation_table)
+    return " ".join(name.split())
+
+
+def _get_subtitle_key_of_comparable(name):
+    """get_subtitle_key for a name from make_gamename_comparable.
+
+    _get_subtitle_key_of_comparable(str) -> str
+    """
+    if ":" in name:
+        # For: "Grand Theft Auto V: Premium Edition" -> "Grand Theft Auto V"
+        name = re_remove_subtitle.sub("", name, 1)
+    return _get_canonical_key_of_comparable(name)
+
+
+def _is_demo(name):
+    """Demos and trials have the same name as the game plus a little, so
+    loose matches would often find them. We never want their art.
+
+    _is_demo(str) -> bool
+    """
+    return " trial" in name or " demo" in name
+
+
+def _get_trigrams(canonical_key):
+    """Get the set of trigrams in a name's canonical key.
+
+    Padded so short names and the start of names still get trigrams.
+
+    _get_trigrams(str) -> set[str]
+    """
+    padded = f"  {canonical_key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _index_apps(apps):
+    """Compute the index keys for apps.
+
+    Runs in worker processes for big catalogues, so this is a module function.
+
+    Returns (appid, name, canonical key for similar names or None, [(index
+    key, rank)]) for each app.
+
+    _index_apps(list[(int,str)]) -> list[(int,str,str,list[(str,int)])]
+    """
+    indexed = []
+    for appid, name in apps:
+        comparable = make_gamename_comparable(name)
+        canonical = _get_canonical_key_of_comparable(comparable)
+        keys = [(comparable, k_rank_exact), (canonical, k_rank_canonical)]
+        if _is_demo(comparable):
+            canonical = None
+        else:
+            subtitle = _get_subtitle_key_of_comparable(comparable)
+            keys.append((subtitle, k_rank_subtitle))
+        indexed.append((appid, name, canonical, keys))
+    return indexed
+
+
+def _index_apps_in_parallel(apps):
+    """Compute the index keys for apps, using every core for big catalogues.
+
+    _index_apps_in_parallel(list[(int,str)]) -> list[(int,str,str,list[(str,int)])]
+    """
+    if len(apps) < k_parallel_index_threshold or (os.cpu_count() or 1) < 2:
+        return _index_apps(apps)
+
+    chunks = [
+        apps[i : i + k_parallel_index_chunk]
+        for i in range(0, len(apps), k_parallel_index_chunk)
+    ]
+    indexed = []
+    try:
+        with ProcessPoolExecutor() as pool:
+            for chunk in pool.map(_index_apps, chunks):
+                indexed.extend(chunk)
+    except (OSError, BrokenProcessPool) as e:
+        # Some environments can't start processes. It's just slower.
+        print(f"Indexing app list on one process: {e}")
+        return _index_apps(apps)
+    return indexed
+
+
+class AppListSyncError(Exception):
+    """Steam didn't give us a complete app list"""
+
+
+def _fetch_apps(session, api_url, steam_api_key, if_modified_since=None):
+    """Download every page of apps from GetAppList.
+
+    Returns a list of (appid, name) sorted by appid.
+
+    _fetch_apps(requests.Session, str, str, datetime) -> list[(int,str)]
+    """
+    params = {"key": steam_api_key, "max_results": k_page_size}
+    if if_modified_since:
+        # We store naive utc times.
+        since = if_modified_since.replace(tzinfo=timezone.utc)
+        params["if_modified_since"] = int(since.timestamp())
+
+    deadline = time.monotonic() + k_sync_deadline.total_seconds()
+    apps = []
+    for _ in range(k_max_pages):
+        if time.monotonic() > deadline:
+            raise AppListSyncError(
+                f"Took longer than {k_sync_deadline} to download the app list"
+            )
+        response = session.get(api_url, params=params, timeout=k_http_timeout)
+        if response.status_code != 200:
+            raise AppListSyncError(
+                f"Error {response.status_code} downloading the app list"
+            )
+        page = response.json().get("response", {})
+        apps.extend((g["appid"], g.get("name", "")) for g in page.get("apps", []))
+        if not page.get("have_more_results"):
+            return apps
+        last_appid = page.get("last_appid")
+        if last_appid is None:
+            raise AppListSyncError("App list has more results but didn't say where")
+        params["last_appid"] = last_appid
+
+    raise AppListSyncError(f"App list didn't end after {k_max_pages} pages")
+
+
+def _placeholders(values):
+    """Get the sql parameter placeholders for an IN clause with these values.
+
+    _placeholders(list) -> str
+    """
+    return ",".join("?" * len(values))
+
+
+class AppList:
+    """
+    Steam's catalogue of app names to appids, kept in a sqlite database in the
+    cache folder so looking up a name only reads the rows it needs instead of
+    loading the whole catalogue into memory.
+
+    `keys` maps each app's comparable name, canonical key and subtitle key
+    (with their rank) to the appid, so lookup finds a name in one query.
+    `apps` remembers every app's name so we can update the indexes when only
+    some apps changed.
+
+    For names that don't match exactly, `postings` is an inverted index of
+    trigrams of canonical keys to the apps that have them, along with how many
+    trigrams each app has so similarity is computed in sql from the count of
+    shared trigrams. `grams` counts the apps with each trigram so
+    find_similar can start from the rarest ones.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        # Art is downloaded from worker threads, so share the connection and
+        # serialize access ourselves.
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != k_schema_version:
+            self._create_schema()
+
+    def _create_schema(self):
+        with self._db:
+            self._db.executescript(
+                f"""
+                DROP TABLE IF EXISTS meta;
+                DROP TABLE IF EXISTS apps;
+                DROP TABLE IF EXISTS names;
+                DROP TABLE IF EXISTS stripped;
+                DROP TABLE IF EXISTS keys;
+                DROP TABLE IF EXISTS grams;
+                DROP TABLE IF EXISTS postings;
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+                CREATE TABLE apps (appid INTEGER PRIMARY KEY, name TEXT NOT NULL, canonical_key TEXT);
+                CREATE TABLE keys (key TEXT, rank INTEGER, appid INTEGER NOT NULL, PRIMARY KEY (key, rank)) WITHOUT ROWID;
+                CREATE INDEX keys_appid ON keys (appid);
+                CREATE TABLE grams (gram TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID;
+                CREATE TABLE postings (gram TEXT, gram_count INTEGER, appid INTEGER, PRIMARY KEY (gram, gram_count, appid)) WITHOUT ROWID;
+                PRAGMA user_version = {k_schema_version};
+                """
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, name):
+        """Get the appid of the app whose name best matches this one.
+
+        Prefers matches on the least changed form of the query, and then on
+        the least changed form of the app's name.
+
+        lookup(str) -> int
+        """
+        comparable = make_gamename_comparable(name)
+        query = [
+            comparable,
+            _get_canonical_key_of_comparable(comparable),
+            _get_subtitle_key_of_comparable(comparable),
+        ]
+        with self._lock:
+            row = self._db.execute(
+                """
+                SELECT appid FROM keys WHERE key IN (?1, ?2, ?3)
+                ORDER BY CASE key WHEN ?1 THEN 0 WHEN ?2 THEN 1 ELSE 2 END, rank
+                LIMIT 1
+                """,
+                query,
+            ).fetchone()
+        # Might return None.
+        return row[0] if row else None
+
+    def _get_timestamp(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return datetime.fromisoformat(row[0])
+
+    def get_download_timestamp(self):
+        """When the app list was last updated from Steam.
+
+        get_download_timestamp() -> datetime
+        """
+        return self._get_timestamp("download_timestamp")
+
+    def sync(self, session, steam_api_key, api_url=k_api_url):
+        """Bring the app list up to date with Steam.
+
+        Downloads the whole list if we don't have one (or it's very old),
+        otherwise only fetches apps that changed since the last sync. If an
+        update fails, we keep using the list we already have.
+
+        sync(requests.Session, str, str) -> None
+        """
+        now = datetime.utcnow()
+        last_sync = self.get_download_timestamp()
+        last_rebuild = self._get_timestamp("rebuild_timestamp")
+
+        if not last_sync or not last_rebuild or now - last_rebuild > k_rebuild_age:
+            print("Downloading latest app list from Steam...")
+            try:
+                apps = _fetch_apps(session, api_url, steam_api_key)
+            except (AppListSyncError, OSError, ValueError) as e:
+                if not last_sync:
+                    raise
+                print(f"Failed to download app list, using the old one: {e}")
+                return
+            self._store(apps, now, rebuild=True)
+            print(f"Downloaded {len(apps)} apps")
+        elif now - last_sync > k_refresh_age:
+            print("Updating app list from Steam...")
+            try:
+                apps = _fetch_apps(
+                    session,
+                    api_url,
+                    steam_api_key,
+                    if_modified_since=last_sync - k_modified_since_slack,
+                )
+            except (AppListSyncError, OSError, ValueError) as e:
+                # requests' errors are OSErrors and bad json is a ValueError.
+                print(f"Failed to update app list, using the old one: {e}")
+                return
+            self._store(apps, now, rebuild=False)
+            print(f"Updated {len(apps)} apps")
+
+    def _store(self, apps, download_timestamp, rebuild):
+        """Save downloaded apps into the indexes.
+
+        When rebuild is set, apps is the whole catalogue and replaces what we
+        have. Otherwise apps are merged into the existing indexes, replacing
+        anything we knew about those appids.
+
+        _store(list[(int,str)], datetime, bool) -> None
+        """
+        appids = [(appid,) for appid, _ in apps]
+        indexed = _index_apps_in_parallel([(a, n) for a, n in apps if n])
+        keys = [(key, rank, appid) for appid, _, _, k in indexed for key, rank in k]
+        # Inserting in key order keeps sqlite appending to its b-trees.
+        keys.sort()
+        postings = {}
+        for appid, _, canonical, _ in indexed:
+            if canonical:
+                grams = _get_trigrams(canonical)
+                for g in grams:
+                    postings.setdefault(g, []).append((len(grams), appid))
+
+        with self._lock, self._db:
+            if rebuild:
+                for table in ["apps", "keys", "grams", "postings"]:
+                    self._db.execute(f"DELETE FROM {table}")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('rebuild_timestamp', ?)",
+                    (download_timestamp.isoformat(),),
+                )
+                changed_grams = set()
+            else:
+                # Forget old names of changed apps.
+                self._db.executemany("DELETE FROM keys WHERE appid = ?", appids)
+                changed_grams = self._remove_from_grams(appids)
+                self._db.executemany("DELETE FROM apps WHERE appid = ?", appids)
+
+            self._db.executemany(
+                "INSERT INTO apps (appid, name, canonical_key) VALUES (?, ?, ?)",
+                ((appid, name, canonical) for appid, name, canonical, _ in indexed),
+            )
+            # Later (higher) appids win when keys collide.
+            self._db.executemany(
+                "INSERT OR REPLACE INTO keys (key, rank, appid) VALUES (?, ?, ?)", keys
+            )
+            self._db.executemany(
+                "INSERT INTO postings (gram, gram_count, appid) VALUES (?, ?, ?)",
+                (
+                    (g, gram_count, appid)
+                    for g in sorted(postings)
+                    for gram_count, appid in sorted(postings[g])
+                ),
+            )
+
+            if rebuild:
+                self._db.executemany(
+                    "INSERT INTO grams (gram, count) VALUES (?, ?)",
+                    ((g, len(ids)) for g, ids in sorted(postings.items())),
+                )
+            else:
+                changed_grams.update(postings)
+                self._db.executemany(
+                    """
+                    INSERT OR REPLACE INTO grams (gram, count)
+                    SELECT ?1, COUNT(*) FROM postings WHERE gram = ?1
+                    """,
+                    ((g,) for g in sorted(changed_grams)),
+                )
+                self._db.execute("DELETE FROM grams WHERE count = 0")
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('download_timestamp', ?)",
+                (download_timestamp.isoformat(),),
+            )
+
+    def _remove_from_grams(self, appids):
+        """Remove these apps from the trigrams of their current names.
+
+        Returns the trigrams whose counts need updating.
+
+        _remove_from_grams(list[(int,)]) -> set[str]
+        """
+        changed = set()
+        for (appid,) in appids:
+            row = self._db.execute(
+                "SELECT canonical_key FROM apps WHERE appid = ?", (appid,)
+            ).fetchone()
+            if not row or not row[0]:
+                continue
+            grams = _get_trigrams(row[0])
+            self._db.executemany(
+                "DELETE FROM postings WHERE gram = ? AND gram_count = ? AND appid = ?",
+                ((g, len(grams), appid) for g in grams),
+            )
+            changed |= grams
+        return changed
+
+    def find_similar(self, name, threshold):
+        """Find the app with the most similar name.
+
+        Similarity is the Dice coefficient of the names' trigrams, from 0 (no
+        trigrams in common) to 1 (same trigrams). Only apps at least threshold
+        similar are considered.
+
+        Instead of comparing against every app, we only look at apps sharing
+        one of the query's rarest trigrams: an app missing all of them can't
+        share enough trigrams to reach the threshold. Of those, we only score
+        the k_max_similar_candidates most likely to be similar, so a match
+        that shares few of the rare trigrams can be missed.
+
+        Returns the appid and its similarity, or None and 0 if no app is
+        similar enough.
+
+        find_similar(str, float) -> (int, float)
+        """
+        query = sorted(_get_trigrams(get_canonical_key(name)))
+        if not query or threshold <= 0:
+            return None, 0.0
+
+        # Dice = 2*overlap / (len(query) + len(candidate)) and overlap can't
+        # be more than either length, so this bounds both.
+        min_overlap = math.ceil(threshold * len(query) / (2 - threshold))
+        max_grams = math.floor((2 - threshold) * len(query) / threshold)
+
+        with self._lock:
+            counts = dict(
+                self._db.execute(
+                    f"SELECT gram, count FROM grams WHERE gram IN ({_placeholders(query)})",
+                    query,
+                )
+            )
+            # Trigrams nobody has can't find anything.
+            if len(counts) < min_overlap:
+                return None, 0.0
+            present = sorted(counts, key=counts.get)
+            prefix = present[: len(present) - min_overlap + 1]
+            # Apps sharing a larger part of the rare trigrams are likely to
+            # share a similar part of the rest, so rank them by the score
+            # they'd have if they did.
+            row = self._db.execute(
+                f"""
+                WITH candidates (appid, gram_count) AS (
+                    SELECT appid, gram_count FROM postings
+                    WHERE gram IN ({_placeholders(prefix)}) AND gram_count BETWEEN ? AND ?
+                    GROUP BY appid
+                    ORDER BY COUNT(*) * 1.0 / (? + gram_count) DESC, appid
+                    LIMIT ?
+                ), scores (appid, score) AS (
+                    SELECT appid, 2.0 * (
+                        SELECT COUNT(*) FROM postings
+                        WHERE gram IN ({_placeholders(query)})
+                            AND postings.gram_count = candidates.gram_count
+                            AND postings.appid = candidates.appid
+                    ) / (? + gram_count)
+                    FROM candidates
+                )
+                SELECT appid, score FROM scores WHERE score >= ?
+                -- Prefer the older app on ties, it's usually the original game.
+                ORDER BY score DESC, appid
+                LIMIT 1
+                """,
+                [
+                    *prefix,
+                    min_overlap,
+                    max_grams,
+                    len(query),
+                    k_max_similar_candidates,
+                    *query,
+                    len(query),
+                    threshold,
+                ],
+            ).fetchone()
+
+        if not row:
+            return None, 0.0
+        return row[0], row[1]
+
+    def migrate_from_json(self, json_path):
+        """Import the applist.json (version 3) written by older versions of
+        steamsync and delete it.
+
+        Returns whether anything was imported.
+
+        migrate_from_json(Path) -> bool
+        """
+        if not json_path.is_file():
+            return False
+
+        try:
+            with json_path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == 3:
+                # The comparable names are good enough stand-ins for the real
+                # names, and the stripped names are derived from them.
+                apps = [
+                    (int(appid), name) for name, appid in data["name_to_id"].items()
+                ]
+                download_timestamp = datetime.fromisoformat(data["download_timestamp"])
+            else:
+                apps = None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            # Unreadable or not what version 3 wrote.
+            apps = None
+
+        imported = False
+        if apps is not None:
+            print(f"Moving app list from {json_path.name} to {k_applist_db_fname}...")
+            # Keep the old download time, so sync updates and eventually
+            # replaces the imported list (and its stand-in names) as usual
+            # instead of downloading everything right away.
+            self._store(apps, download_timestamp, rebuild=True)
+            imported = True
+
+        json_path.unlink()
+        return imported
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Keep downloaded art once and copy it into grid folders.
+
+Images are stored under their hash, and an index maps what each image is
+(like the hero art for an appid) to the stored image and the validators
+the server sent with it. Putting art in a grid folder again (for another
+user, a renamed shortcut, or a cleaned grid folder) doesn't download it.
+Images the index no longer uses are deleted when it's saved. Grid folders
+never share files with the store, so that can't break their art.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+import steamsync.util as util
+
+k_index_fname = "index.json"
+k_index_version = 1
+# From linux/fs.h
+k_ficlone = 0x40049409
+# Downloads left unfinished for this long were interrupted.
+k_stale_part_seconds = 24 * 60 * 60
+
+
+class ArtStore:
+    """
+    Content-addressed store of downloaded art
+    """
+
+    def __init__(self, folder):
+        """
+        :folder: Where to keep the images and index.
+        """
+        self.folder = Path(folder)
+        self._objects = self.folder / "objects"
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    def _get_entries(self):
+        if self._entries is None:
+            self._entries = util.load_json_cache(
+                self.folder / k_index_fname, k_index_version
+            )
+        return self._entries
+
+    def get_path(self, entry):
+        return self._objects / f"{entry['sha256']}{entry['ext']}"
+
+    def get(self, key, url):
+        """Get what we stored for key, if it came from url and we still
+        have the image.
+
+        get(str, str) -> dict
+        """
+        with self._lock:
+            entry = self._get_entries().get(key)
+        if entry and entry["url"] == url and self.get_path(entry).is_file():
+            return entry
+        return None
+
+    def add(self, key, url, chunks, ext, headers):
+        """Store an image as it downloads and remember it as key.
+
+        add(str, str, iterator[bytes], str, dict) -> dict
+        """
+        self._objects.mkdir(parents=True, exist_ok=True)
+        sha256 = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=self._objects, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    f.write(chunk)
+            entry = {
+                "url": url,
+                "sha256": sha256.hexdigest(),
+                "ext": ext,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+            os.replace(tmp_name, self.get_path(entry))
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        with self._lock:
+            self._get_entries()[key] = entry
+            self._dirty = True
+        return entry
+
+    def copy_to(self, entry, dest):
+        """Put a copy of a stored image at dest, replacing what's there.
+
+        Uses a reflink where the filesystem supports them (btrfs, xfs), so
+        the image isn't duplicated on disk. Never a hard link or symlink:
+        Steam and users can change grid images in place, which would change
+        the stored image too, and pruning the store would break symlinks.
+
+        copy_to(dict, Path) -> None
+        """
+        src = self.get_path(entry)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=dest.parent, prefix=f".{dest.name}.", suffix=".part"
+        )
+        os.close(fd)
+        os.unlink(tmp_name)
+        try:
+            try:
+                _reflink(src, tmp_name)
+            except OSError:
+                shutil.copyfile(src, tmp_name)
+            # Steam never sees a missing or partial image.
+            os.replace(tmp_name, dest)
+        except BaseException:
+            if os.path.lexists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+    def save(self):
+        """Write the index and delete images it no longer uses.
+
+        save() -> None
+        """
+        with self._lock:
+            if self._dirty:
+                util.save_json_cache(
+                    self.folder / k_index_fname, k_index_version, self._entries
+                )
+                self._dirty = False
+                # Only once the index is saved, so it never points at a
+                # deleted image.
+                self._prune()
+
+    def _prune(self):
+        """Delete images no entry uses (like old versions of updated art)
+        and downloads that were interrupted.
+        """
+        used = {self.get_path(entry).name for entry in self._entries.values()}
+        cutoff = time.time() - k_stale_part_seconds
+        if not self._objects.is_dir():
+            return
+        for path in self._objects.iterdir():
+            if path.name in used:
+                continue
+            try:
+                if path.suffix == ".part" and path.stat().st_mtime > cutoff:
+                    # Might still be downloading.
+                    continue
+                path.unlink()
+            except OSError:
+                # Already gone, or in use on Windows. Try again next time.
+                pass
+
+
+def _reflink(src, dest):
+    """Make dest share src's data on filesystems that support it (btrfs,
+    xfs).
+
+    _reflink(Path, str) -> None
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks aren't supported")
+    with open(src, "rb") as s:
+        d = open(dest, "xb")
+        try:
+            with d:
+                fcntl.ioctl(d.fileno(), k_ficlone, s.fileno())
+        except OSError:
+            os.unlink(dest)
+            raise
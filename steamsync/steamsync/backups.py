@@ -0,0 +1,243 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Keep backups of shortcuts.vdf outside of Steam's folders.
+
+Each distinct version of the file is stored once, compressed and named by
+its hash. An index records when each backup was made, and old backups are
+pruned by a retention policy. Backups imported from the .bak files older
+versions wrote are never pruned, since they might be the only copy of a
+file from long ago.
+"""
+
+import datetime
+import glob
+import gzip
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import appdirs
+
+import steamsync.util as util
+
+k_index_fname = "index.json"
+k_index_version = 1
+k_keep_last = 10
+k_keep_daily = 7
+k_keep_weekly = 4
+k_bak_time_format = "%Y%m%d-%H%M%S"
+
+
+def get_default_folder(steamid):
+    """Get where we keep backups for a Steam user.
+
+    get_default_folder(str) -> Path
+    """
+    return Path(appdirs.user_data_dir("steamsync")) / "backups" / steamid
+
+
+class Backup:
+    """
+    Data class for one backup in the store
+    """
+
+    def __init__(self, sha256, timestamp, size, imported=False):
+        self.sha256 = sha256
+        self.timestamp = timestamp
+        self.size = size
+        self.imported = imported
+
+    def get_time(self):
+        return datetime.datetime.fromtimestamp(self.timestamp)
+
+
+class BackupStore:
+    """
+    Content-addressed store of shortcuts.vdf backups for one user
+    """
+
+    def __init__(
+        self,
+        folder,
+        keep_last=k_keep_last,
+        keep_daily=k_keep_daily,
+        keep_weekly=k_keep_weekly,
+    ):
+        """
+        :folder: Where to keep backups.
+        :keep_last: How many of the newest backups to keep.
+        :keep_daily: How many days to keep the last backup of.
+        :keep_weekly: How many weeks to keep the last backup of.
+        """
+        self.folder = Path(folder)
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        entries = util.load_json_cache(self.folder / k_index_fname, k_index_version)
+        self._backups = [
+            Backup(b["sha256"], b["timestamp"], b["size"], b.get("imported", False))
+            for b in entries.get("backups", [])
+        ]
+
+    def _get_object_path(self, sha256):
+        return self.folder / f"{sha256}.vdf.gz"
+
+    def list_backups(self):
+        """Get every backup, newest first.
+
+        list_backups() -> list[Backup]
+        """
+        return sorted(self._backups, key=lambda b: b.timestamp, reverse=True)
+
+    def add(self, data, timestamp=None):
+        """Back up the contents of shortcuts.vdf.
+
+        Returns the new backup, or None if the newest backup already has
+        this content.
+
+        add(bytes, float) -> Backup
+        """
+        backup = self._add(data, timestamp)
+        if backup:
+            self._prune()
+            self._save()
+        return backup
+
+    def _add(self, data, timestamp, imported=False):
+        if timestamp is None:
+            timestamp = time.time()
+        sha256 = hashlib.sha256(data).hexdigest()
+        newest = next(iter(self.list_backups()), None)
+        if newest and newest.sha256 == sha256 and newest.timestamp <= timestamp:
+            # Nothing changed since the last backup.
+            return None
+
+        path = self._get_object_path(sha256)
+        if not path.is_file():
+            self.folder.mkdir(parents=True, exist_ok=True)
+            # No mtime in the header so the same content always compresses
+            # to the same file.
+            util.atomic_write_bytes(path, gzip.compress(data, mtime=0))
+        backup = Backup(sha256, timestamp, len(data), imported)
+        self._backups.append(backup)
+        return backup
+
+    def read(self, backup):
+        """Get the contents of shortcuts.vdf from a backup.
+
+        read(Backup) -> bytes
+        """
+        with gzip.open(self._get_object_path(backup.sha256), "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != backup.sha256:
+            raise ValueError(f"Backup {backup.sha256} is corrupt")
+        return data
+
+    def find(self, selector):
+        """Find a backup by its number in list_backups (1 is newest) or by
+        the start of its hash.
+
+        find(str) -> Backup
+        """
+        backups = self.list_backups()
+        if selector.isdigit() and 0 < int(selector) <= len(backups):
+            return backups[int(selector) - 1]
+        matches = {b.sha256 for b in backups if b.sha256.startswith(selector.lower())}
+        if len(matches) == 1:
+            sha256 = matches.pop()
+            return next(b for b in backups if b.sha256 == sha256)
+        return None
+
+    def restore(self, backup, shortcut_file_path):
+        """Replace shortcuts.vdf with a backup.
+
+        The current file is backed up first, so a restore can be undone.
+
+        restore(Backup, str) -> None
+        """
+        data = self.read(backup)
+        try:
+            with open(shortcut_file_path, "rb") as f:
+                self.add(f.read())
+        except FileNotFoundError:
+            pass
+        util.atomic_write_bytes(shortcut_file_path, data)
+
+    def migrate_bak_files(self, shortcut_file_path):
+        """Move the shortcuts.vdf-{time}.bak files that we used to write next
+        to shortcuts.vdf into the store. They're kept however old they are.
+
+        Returns how many files we moved.
+
+        migrate_bak_files(str) -> int
+        """
+        bak_files = find_bak_files(shortcut_file_path)
+        for bak in bak_files:
+            stamp = bak[len(shortcut_file_path) + 1 : -len(".bak")]
+            try:
+                timestamp = time.mktime(time.strptime(stamp, k_bak_time_format))
+            except ValueError:
+                timestamp = os.path.getmtime(bak)
+            with open(bak, "rb") as f:
+                self._add(f.read(), timestamp, imported=True)
+        if bak_files:
+            self._save()
+            # Only delete them once the index knows about them.
+            for bak in bak_files:
+                os.remove(bak)
+        return len(bak_files)
+
+    def _prune(self):
+        """Forget backups the retention policy doesn't keep and delete
+        content no backup uses.
+        """
+        keep = {b for b in self._backups if b.imported}
+        days = set()
+        weeks = set()
+        for i, backup in enumerate(self.list_backups()):
+            when = backup.get_time()
+            day = when.date()
+            week = when.isocalendar()[:2]
+            if i < self.keep_last:
+                keep.add(backup)
+            if day not in days and len(days) < self.keep_daily:
+                keep.add(backup)
+            if week not in weeks and len(weeks) < self.keep_weekly:
+                keep.add(backup)
+            days.add(day)
+            weeks.add(week)
+        self._backups = [b for b in self._backups if b in keep]
+
+        used = {b.sha256 for b in self._backups}
+        if self.folder.is_dir():
+            for path in self.folder.glob("*.vdf.gz"):
+                if path.name[: -len(".vdf.gz")] not in used:
+                    path.unlink()
+
+    def _save(self):
+        util.save_json_cache(
+            self.folder / k_index_fname,
+            k_index_version,
+            {
+                "backups": [
+                    {
+                        "sha256": b.sha256,
+                        "timestamp": b.timestamp,
+                        "size": b.size,
+                        "imported": b.imported,
+                    }
+                    for b in self._backups
+                ]
+            },
+        )
+
+
+def find_bak_files(shortcut_file_path):
+    """Find the shortcuts.vdf-{time}.bak files that older versions wrote next
+    to shortcuts.vdf.
+
+    find_bak_files(str) -> list[str]
+    """
+    return glob.glob(glob.escape(shortcut_file_path) + "-*.bak")
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Tell whether anything changed since the last sync.
+
+A sync's result depends on what the stores have installed, the options we
+ran with, and the shortcuts and art Steam already has. If none of those
+changed since the last successful sync, running again would do nothing.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import steamsync.util as util
+
+k_fingerprint_fname = "last_sync.json"
+k_fingerprint_version = 1
+# Options that don't change what a sync does when it succeeds.
+k_ignored_options = {
+    "force",
+    "watch",
+    "launcher_timeout",
+    "command_timeout",
+    "art_download_workers",
+}
+
+
+def get_inputs(args, launchers):
+    """Get what we'll sync from: options and store inventories.
+
+    Returns None if a store can't tell whether its games changed without
+    collecting them.
+
+    get_inputs(Namespace, dict[str, Launcher]) -> list
+    """
+    inventories = {}
+    for tag, l in sorted(launchers.items()):
+        if not l.is_installed():
+            continue
+        inventory = l.get_inventory_fingerprint()
+        if inventory is None:
+            return None
+        inventories[tag] = inventory
+    options = {k: v for k, v in vars(args).items() if k not in k_ignored_options}
+    return [options, inventories]
+
+
+def get_outputs(user, steam_path):
+    """Get the state of what we sync to: the user's shortcuts.vdf and art.
+
+    get_outputs(SteamAccount, Path) -> list
+    """
+    grid = []
+    try:
+        with os.scandir(user.get_grid_folder(steam_path)) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                grid.append([entry.name, stat.st_size, stat.st_mtime_ns])
+    except OSError:
+        pass
+    return [
+        util.hash_file(user.get_shortcut_filepath(steam_path)),
+        sorted(grid),
+    ]
+
+
+def compute(inputs, outputs):
+    """Combine inputs and outputs into one fingerprint.
+
+    compute(list, list) -> str
+    """
+    data = json.dumps([inputs, outputs], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def load_last(cache_folder, steamid):
+    """Get the fingerprint of the user's last successful sync.
+
+    load_last(Path, str) -> str
+    """
+    fname = Path(cache_folder) / k_fingerprint_fname
+    return util.load_json_cache(fname, k_fingerprint_version).get(steamid)
+
+
+def save(cache_folder, steamid, fingerprint):
+    """Remember the fingerprint of a successful sync.
+
+    save(Path, str, str) -> None
+    """
+    fname = Path(cache_folder) / k_fingerprint_fname
+    entries = util.load_json_cache(fname, k_fingerprint_version)
+    entries[steamid] = fingerprint
+    util.save_json_cache(fname, k_fingerprint_version, entries)
@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Answer whether game files exist without probing each one.
+
+Launchers and remove-missing check lots of paths, often several in the same
+folder, and each check is a round trip when games are on a network share.
+FsProbe lists each folder once and answers from the listing.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+_is_windows = os.name == "nt"
+
+
+class _Listing:
+    """
+    What we found when listing one folder
+    """
+
+    def __init__(self, files, others):
+        # Names are normcased so Windows lookups aren't case sensitive.
+        self.files = files
+        self.others = others
+
+
+# The folder exists, but we can't list it (like WindowsApps).
+_unlistable = object()
+
+
+class FsProbe:
+    """
+    Memoised existence checks, answered from a listing of each parent folder
+
+    Folders are listed on first use. Call prefetch to list many folders at
+    once. Listings of different volumes run concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # normcased folder -> _Listing, _unlistable, or None if missing
+        self._listings = {}
+        # path -> bool, for files in folders we can't list
+        self._direct = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Forget everything we've listed, for when files may have changed."""
+        with self._lock:
+            self._listings.clear()
+            self._direct.clear()
+
+    def _get_listing(self, folder):
+        key = os.path.normcase(folder)
+        with self._lock:
+            if key in self._listings:
+                self.hits += 1
+                return self._listings[key]
+            self.misses += 1
+
+        try:
+            files = set()
+            others = set()
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    name = os.path.normcase(entry.name)
+                    try:
+                        is_file = entry.is_file()
+                    except OSError:
+                        is_file = False
+                    (files if is_file else others).add(name)
+            listing = _Listing(files, others)
+        except (FileNotFoundError, NotADirectoryError):
+            listing = None
+        except OSError:
+            listing = _unlistable
+
+        with self._lock:
+            self._listings[key] = listing
+        return listing
+
+    def _probe_directly(self, path, check):
+        key = (os.fspath(path), check.__name__)
+        with self._lock:
+            if key in self._direct:
+                return self._direct[key]
+        try:
+            result = check(path)
+        except OSError:
+            result = False
+        with self._lock:
+            self._direct[key] = result
+        return result
+
+    def _lookup(self, path):
+        """Find path in its folder's listing.
+
+        Returns "file", "other", None if it doesn't exist, or the listing
+        sentinel if we couldn't list the folder.
+        """
+        path = os.path.abspath(path)
+        folder, name = os.path.split(path)
+        if not name:
+            # A root has no folder to list.
+            return _unlistable
+        listing = self._get_listing(folder)
+        if listing is None:
+            return None
+        if listing is _unlistable:
+            return _unlistable
+        name = os.path.normcase(name)
+        if name in listing.files:
+            return "file"
+        if name in listing.others:
+            return "other"
+        return None
+
+    def exists(self, path):
+        """Does the file or folder exist?
+
+        exists(Path) -> bool
+        """
+        found = self._lookup(path)
+        if found is _unlistable:
+            return self._probe_directly(path, os.path.exists)
+        return found is not None
+
+    def is_file(self, path):
+        """Is path a file (or a link to one)?
+
+        is_file(Path) -> bool
+        """
+        found = self._lookup(path)
+        if found is _unlistable:
+            return self._probe_directly(path, os.path.isfile)
+        return found == "file"
+
+    def is_readable_file(self, path):
+        """Is path a file that we can read?
+
+        On Windows, that's true of every file we can list. Elsewhere it
+        depends on permissions we can't see in a listing, so we ask about
+        files that exist.
+
+        is_readable_file(Path) -> bool
+        """
+        if not self.is_file(path):
+            return False
+        if _is_windows:
+            return True
+        return self._probe_directly(path, _is_readable)
+
+    def prefetch(self, paths):
+        """List the folders containing paths so later checks are answered
+        from memory.
+
+        Each volume's folders are listed one at a time on their own thread,
+        so slow network shares don't hold up each other or local drives.
+
+        prefetch(list[Path]) -> None
+        """
+        by_volume = {}
+        for path in paths:
+            folder = os.path.dirname(os.path.abspath(path))
+            by_volume.setdefault(Path(folder).anchor, set()).add(folder)
+        if not by_volume:
+            return
+
+        def list_all(folders):
+            for folder in folders:
+                self._get_listing(folder)
+
+        with ThreadPoolExecutor(max_workers=len(by_volume)) as pool:
+            for f in [pool.submit(list_all, folders) for folders in by_volume.values()]:
+                f.result()
+
+    def get_stats(self):
+        """Describe how well the cache worked.
+
+        get_stats() -> str
+        """
+        with self._lock:
+            return f"{self.hits} cache hits, {self.misses} folder listings"
+
+
+def _is_readable(path):
+    return os.access(path, os.R_OK)
+
+
+_probe = FsProbe()
+
+
+def get_probe():
+    """Get the probe shared by everything in this process.
+
+    get_probe() -> FsProbe
+    """
+    return _probe
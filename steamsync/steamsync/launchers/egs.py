@@ -1,104 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 import os
 
 import steamsync.defs as defs
+import steamsync.fsprobe as fsprobe
+import steamsync.util as util
 
 import steamsync.launchers.launcher as launcher
 
+k_scan_cache_fname = "egs_scan.json"
+k_scan_cache_version = 1
+k_parse_workers = 8
+
 
 class EpicGamesStoreLauncher(launcher.Launcher):
-    def __init__(self, egs_manifest_path: str):
+    def __init__(self, egs_manifest_path: str, cache_folder: str = None):
+        """
+        :cache_folder: Where to remember scanned manifests. None to scan
+        every manifest every time.
+        """
         self.egs_manifest_path = egs_manifest_path
+        self.cache_folder = cache_folder
 
     def collect_games(self) -> list[defs.GameDefinition]:
         print(f"\nScanning EGS manifest store ({self.egs_manifest_path})...")
-        # loop over every .item fiile
-        pathlist = Path(self.egs_manifest_path).glob("*.item")
-        games = list()
-
-        for path in pathlist:
-            # EGS seems to write their json files out as utf-8
-            with open(path, "r", encoding="utf-8") as f:
-                item = json.load(f)
-
-                app_name = path
-                display_name = path
-
-                if "AppName" in item:
-                    app_name = item["AppName"]
-                if "DisplayName" in item:
-                    display_name = item["DisplayName"]
-
-                if item["bIsIncompleteInstall"]:
-                    print(
-                        f"\t- Skipping '{display_name}' since installation is incomplete"
-                    )
-                    continue
-                elif not item["bIsApplication"]:
-                    print(
-                        f"\t- Skipping '{display_name}' since it isn't an application"
-                    )
-                    continue
-                elif "games" not in item["AppCategories"]:
-                    print(
-                        f"\t- Skipping '{display_name}' since it doesn't have the category 'games'"
-                    )
-                    continue
-
-                if "InstallLocation" not in item:
-                    print(
-                        f"\t- Skipping '{display_name}' since it apparently doesn't have an 'InstallLocation'"
-                    )
-                    continue
-
-                install_location = os.path.normpath(item["InstallLocation"])
-
-                if "LaunchExecutable" not in item:
-                    print(
-                        f"\t- Skipping '{display_name}' since it apparently doesn't have an executable"
-                    )
-                    continue
-
-                if "LaunchCommand" not in item:
-                    print(f"\t- '{display_name}' doesn't have LaunchCommands?")
-                    launch_arguments = ""
-                else:
-                    # I think this is for command line arguments...?
-                    launch_arguments = item["LaunchCommand"]
-
-                launch_executable = os.path.normpath(item["LaunchExecutable"])
-
-                if launch_executable[0] in "/\\":
-                    # Sanitize bad paths. RiME uses
-                    # "/RiME/SirenGame/Binaries/Win64/RiME.exe", which looks
-                    # absolute but it isn't.
-                    launch_executable = launch_executable[1:]
-
-                executable_path = os.path.join(install_location, launch_executable)
-
-                # found by looking creating a shortcut on the desktop in the EGL and inspecting it
-                # using the URI instead of executable_path allows some games with online services
-                # to work (eg GTAV)
-
-                if not os.path.exists(executable_path):
-                    print(
-                        f"\t- Warning: path `{executable_path}` does not exist for game {display_name}, skipping!"
-                    )
-                    continue
+        cache_fname = None
+        cache = {}
+        if self.cache_folder:
+            cache_fname = Path(self.cache_folder) / k_scan_cache_fname
+            cache = util.load_json_cache(cache_fname, k_scan_cache_version)
+
+        # Manifests only change when EGS installs or updates something, so
+        # one listing tells us which ones we need to read again.
+        scanned = {}
+        changed = []
+        try:
+            entries = list(os.scandir(self.egs_manifest_path))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.name.endswith(".item") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            scanned[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            cached = cache.get(entry.path)
+            if (
+                not cached
+                or cached["size"] != stat.st_size
+                or cached["mtime_ns"] != stat.st_mtime_ns
+                # Check again in case the game was installed to a drive
+                # that wasn't available last time.
+                or cached["missing_exe"]
+            ):
+                changed.append(entry.path)
+
+        with ThreadPoolExecutor(max_workers=k_parse_workers) as pool:
+            parsed = dict(zip(changed, pool.map(_parse_manifest, changed)))
 
+        games = list()
+        new_cache = {}
+        for path in sorted(scanned):
+            result = parsed.get(path) or cache[path]
+            size, mtime_ns = scanned[path]
+            new_cache[path] = dict(result, size=size, mtime_ns=mtime_ns)
+
+            for msg in result["messages"]:
+                print(msg)
+            fields = result["game"]
+            if fields:
                 games.append(
                     defs.GameDefinition(
-                        executable_path,
-                        display_name,
-                        app_name,
-                        install_location,
-                        launch_arguments,
+                        fields["executable_path"],
+                        fields["display_name"],
+                        fields["app_name"],
+                        fields["install_location"],
+                        fields["launch_arguments"],
                         None,
                         defs.TAG_EPIC,
                     )
                 )
 
+        if cache_fname and new_cache != cache:
+            util.save_json_cache(cache_fname, k_scan_cache_version, new_cache)
+
         print(f"Collected {len(games)} games from the EGS manifest store")
         games.sort()
         return games
@@ -111,3 +96,118 @@ class EpicGamesStoreLauncher(launcher.Launcher):
 
     def is_installed(self) -> bool:
         return True  # todo
+
+    def get_watch_paths(self) -> list[str]:
+        return [self.egs_manifest_path]
+
+    def get_inventory_fingerprint(self):
+        if not self.cache_folder:
+            return None
+        # Games whose exe was missing are found again if the drive comes
+        # back, which no manifest would tell us about.
+        cache = util.load_json_cache(
+            Path(self.cache_folder) / k_scan_cache_fname, k_scan_cache_version
+        )
+        if any(entry["missing_exe"] for entry in cache.values()):
+            return None
+        try:
+            entries = list(os.scandir(self.egs_manifest_path))
+        except FileNotFoundError:
+            return []
+        return sorted(
+            [e.name, e.stat().st_size, e.stat().st_mtime_ns]
+            for e in entries
+            if e.name.endswith(".item") and e.is_file()
+        )
+
+
+def _parse_manifest(path):
+    """Read an EGS .item manifest into the fields we need for a
+    GameDefinition.
+
+    Returns a dict with:
+    * game: the GameDefinition fields, or None if we skip this manifest
+    * messages: what to tell the user about this manifest
+    * missing_exe: whether we skipped it because the exe doesn't exist
+
+    _parse_manifest(str) -> dict
+    """
+    result = {"game": None, "messages": [], "missing_exe": False}
+    messages = result["messages"]
+
+    # EGS seems to write their json files out as utf-8
+    with open(path, "r", encoding="utf-8") as f:
+        item = json.load(f)
+
+    app_name = path
+    display_name = path
+
+    if "AppName" in item:
+        app_name = item["AppName"]
+    if "DisplayName" in item:
+        display_name = item["DisplayName"]
+
+    if item["bIsIncompleteInstall"]:
+        messages.append(
+            f"\t- Skipping '{display_name}' since installation is incomplete"
+        )
+        return result
+    elif not item["bIsApplication"]:
+        messages.append(f"\t- Skipping '{display_name}' since it isn't an application")
+        return result
+    elif "games" not in item["AppCategories"]:
+        messages.append(
+            f"\t- Skipping '{display_name}' since it doesn't have the category 'games'"
+        )
+        return result
+
+    if "InstallLocation" not in item:
+        messages.append(
+            f"\t- Skipping '{display_name}' since it apparently doesn't have an 'InstallLocation'"
+        )
+        return result
+
+    install_location = os.path.normpath(item["InstallLocation"])
+
+    if "LaunchExecutable" not in item:
+        messages.append(
+            f"\t- Skipping '{display_name}' since it apparently doesn't have an executable"
+        )
+        return result
+
+    if "LaunchCommand" not in item:
+        messages.append(f"\t- '{display_name}' doesn't have LaunchCommands?")
+        launch_arguments = ""
+    else:
+        # I think this is for command line arguments...?
+        launch_arguments = item["LaunchCommand"]
+
+    launch_executable = os.path.normpath(item["LaunchExecutable"])
+
+    if launch_executable[0] in "/\\":
+        # Sanitize bad paths. RiME uses
+        # "/RiME/SirenGame/Binaries/Win64/RiME.exe", which looks
+        # absolute but it isn't.
+        launch_executable = launch_executable[1:]
+
+    executable_path = os.path.join(install_location, launch_executable)
+
+    # found by looking creating a shortcut on the desktop in the EGL and inspecting it
+    # using the URI instead of executable_path allows some games with online services
+    # to work (eg GTAV)
+
+    if not fsprobe.get_probe().exists(executable_path):
+        messages.append(
+            f"\t- Warning: path `{executable_path}` does not exist for game {display_name}, skipping!"
+        )
+        result["missing_exe"] = True
+        return result
+
+    result["game"] = {
+        "executable_path": executable_path,
+        "display_name": display_name,
+        "app_name": app_name,
+        "install_location": install_location,
+        "launch_arguments": launch_arguments,
+    }
+    return result
@@ -4,6 +4,8 @@
 
 import gzip
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import steamsync.defs as defs
@@ -11,6 +13,11 @@ import steamsync.launchers.launcher as launcher
 import steamsync.util as util
 import toml
 
+k_scan_cache_fname = "itch_scan.json"
+k_scan_cache_version = 2
+k_scan_workers = 8
+k_receipt_path = Path(".itch/receipt.json.gz")
+
 
 class ItchLauncher(launcher.Launcher):
     """Support for the Itch launcher.
@@ -18,63 +25,78 @@ class ItchLauncher(launcher.Launcher):
     See https://itch.io/app
     """
 
-    def __init__(self, library_path: str):
+    def __init__(self, library_path: str, cache_folder: str = None):
+        """
+        :cache_folder: Where to remember scanned games. None to scan every
+        game every time.
+        """
         self.library_path = library_path
+        self.cache_folder = cache_folder
 
     def collect_games(self) -> list[defs.GameDefinition]:
         print(f"\nScanning itch library folder ({self.library_path})...")
         root = Path(self.library_path)
-        games = []
-        for receipt in root.glob("*/.itch/receipt.json.gz"):
-            r = _load_receipt(receipt)
-            g = r["game"]
-            title = g["title"]
-            if g["classification"] != "game":
-                # print(f"Skipping nongame '{title}' -- '{g['classification']}'.")
+        cache_fname = None
+        cache = {}
+        if self.cache_folder:
+            cache_fname = Path(self.cache_folder) / k_scan_cache_fname
+            cache = util.load_json_cache(cache_fname, k_scan_cache_version)
+
+        # Reading receipts and searching for exes is slow with hundreds of
+        # games, so only look at games whose files changed.
+        scanned = {}
+        changed = []
+        try:
+            folders = list(os.scandir(root))
+        except OSError:
+            folders = []
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+            game_root_dir = Path(folder.path)
+            key = _get_scan_key(game_root_dir, folder.stat())
+            if not key:
+                # Not installed by itch.
                 continue
+            scanned[folder.path] = key
+            cached = cache.get(folder.path)
+            if (
+                not cached
+                or cached["key"] != key
+                # Check again in case the game was repaired without
+                # touching its receipt.
+                or cached["missing_exe"]
+            ):
+                changed.append(game_root_dir)
 
-            game_root_dir = receipt.parent.parent
-            exe, args, label = _get_exe_from_manifest(game_root_dir / ".itch.toml")
-            if not exe:
-                label = ""
-                args = ""
-                exes = [
-                    exe for exe in game_root_dir.glob("*.exe") if _might_be_exe(exe)
-                ]
-                if not exes:
-                    # Look one level deeper.
-                    exes = [
-                        exe
-                        for exe in game_root_dir.glob("*/*.exe")
-                        if _might_be_exe(exe)
-                    ]
-                if not exes:
-                    print(f"Warning: Failed to find executable for game '{title}'.")
-                    continue
-                if len(exes) > 1:
-                    # Ignore Godot's extra game.console.exe executable.
-                    exes = [exe for exe in exes if not exe.name.endswith(".console.exe")]
-                if len(exes) > 1:
-                    exes_list = "\n".join(str(e) for e in exes)
-                    print(
-                        f"Warning: Skipping game '{title}' with multiple executables:\n{exes_list}"
+        with ThreadPoolExecutor(max_workers=k_scan_workers) as pool:
+            found = dict(zip((str(d) for d in changed), pool.map(_scan_game, changed)))
+
+        games = []
+        new_cache = {}
+        for path in sorted(scanned):
+            result = found.get(path) or cache[path]
+            new_cache[path] = dict(result, key=scanned[path])
+
+            for msg in result["messages"]:
+                print(msg)
+            fields = result["game"]
+            if fields:
+                games.append(
+                    defs.GameDefinition(
+                        fields["exe"],
+                        fields["title"],
+                        fields["app_name"],
+                        fields["working_dir"],
+                        fields["args"],
+                        fields["cover_url"],
+                        defs.TAG_ITCH,
                     )
-                    continue
-
-                exe = exes[0]
-
-            # must be folder containing parent for some games (baba is you)
-            working_dir = str(exe.parent)
-            game_def = defs.GameDefinition(
-                str(exe),
-                title,
-                f"{game_root_dir.name}{label}",
-                working_dir,
-                args,
-                g.get("coverUrl"),
-                defs.TAG_ITCH,
-            )
-            games.append(game_def)
+                )
+
+        if cache_fname and new_cache != cache:
+            util.save_json_cache(cache_fname, k_scan_cache_version, new_cache)
+
         if not games:
             if any(f.is_file() for f in root.glob("itch*.exe")):
                 print(
@@ -98,6 +120,123 @@ class ItchLauncher(launcher.Launcher):
     def is_installed(self) -> bool:
         return True  # TODO
 
+    def get_watch_paths(self) -> list[str]:
+        # The library notices games being added or removed, and receipts
+        # notice them being updated.
+        paths = [self.library_path]
+        try:
+            with os.scandir(self.library_path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        paths.append(os.path.join(entry.path, k_receipt_path))
+        except OSError:
+            pass
+        return paths
+
+    def get_inventory_fingerprint(self):
+        if self.cache_folder:
+            # Games whose exe was missing are found again if it comes back,
+            # which no receipt would tell us about.
+            cache = util.load_json_cache(
+                Path(self.cache_folder) / k_scan_cache_fname, k_scan_cache_version
+            )
+            if any(entry["missing_exe"] for entry in cache.values()):
+                return None
+        try:
+            folders = list(os.scandir(self.library_path))
+        except OSError:
+            return []
+        return sorted(
+            [f.name, _get_scan_key(Path(f.path), f.stat())]
+            for f in folders
+            if f.is_dir()
+        )
+
+
+def _get_mtime_ns(path):
+    """Get the modification time of path, or None if it doesn't exist.
+
+    _get_mtime_ns(Path) -> int
+    """
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _get_scan_key(game_root_dir, root_stat):
+    """Get what has to change before we need to scan a game folder again.
+
+    Returns None if the folder has no itch receipt.
+
+    _get_scan_key(Path, os.stat_result) -> list[int]
+    """
+    receipt_mtime = _get_mtime_ns(game_root_dir / k_receipt_path)
+    if receipt_mtime is None:
+        return None
+    return [
+        receipt_mtime,
+        _get_mtime_ns(game_root_dir / ".itch.toml"),
+        root_stat.st_mtime_ns,
+    ]
+
+
+def _scan_game(game_root_dir):
+    """Find the executable for a game installed by itch.
+
+    Returns a dict with:
+    * game: the GameDefinition fields, or None if we skip this game
+    * messages: what to tell the user about this game
+    * missing_exe: whether we skipped it because we couldn't pick an exe
+
+    _scan_game(Path) -> dict
+    """
+    result = {"game": None, "messages": [], "missing_exe": False}
+    r = _load_receipt(game_root_dir / k_receipt_path)
+    g = r["game"]
+    title = g["title"]
+    if g["classification"] != "game":
+        # print(f"Skipping nongame '{title}' -- '{g['classification']}'.")
+        return result
+
+    exe, args, label = _get_exe_from_manifest(game_root_dir / ".itch.toml")
+    if not exe:
+        label = ""
+        args = ""
+        exes = [exe for exe in game_root_dir.glob("*.exe") if _might_be_exe(exe)]
+        if not exes:
+            # Look one level deeper.
+            exes = [exe for exe in game_root_dir.glob("*/*.exe") if _might_be_exe(exe)]
+        if not exes:
+            result["messages"].append(
+                f"Warning: Failed to find executable for game '{title}'."
+            )
+            result["missing_exe"] = True
+            return result
+        if len(exes) > 1:
+            # Ignore Godot's extra game.console.exe executable.
+            exes = [exe for exe in exes if not exe.name.endswith(".console.exe")]
+        if len(exes) > 1:
+            exes_list = "\n".join(str(e) for e in exes)
+            result["messages"].append(
+                f"Warning: Skipping game '{title}' with multiple executables:\n{exes_list}"
+            )
+            result["missing_exe"] = True
+            return result
+
+        exe = exes[0]
+
+    result["game"] = {
+        "exe": str(exe),
+        "title": title,
+        "app_name": f"{game_root_dir.name}{label}",
+        # must be folder containing parent for some games (baba is you)
+        "working_dir": str(exe.parent),
+        "args": args,
+        "cover_url": g.get("coverUrl"),
+    }
+    return result
+
 
 def _load_receipt(path_to_receipt: str) -> dict:
     """Load itch's receipt.json.gz.
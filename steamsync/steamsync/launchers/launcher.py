@@ -30,3 +30,15 @@ class Launcher(abc.ABC):
     def is_installed(self) -> bool:
         """Return if this store appears to be installed or not"""
         return False
+
+    def get_watch_paths(self) -> list[str]:
+        """Return files and folders that change when games are installed or
+        uninstalled, so --watch knows when to collect games again. Empty if
+        there's nothing cheap to watch."""
+        return []
+
+    def get_inventory_fingerprint(self):
+        """Return a json-compatible value that changes whenever collect_games
+        would find different games, or None if we can't tell without
+        collecting them. Lets steamsync skip syncs when nothing changed."""
+        return None
@@ -1,52 +1,62 @@
-import subprocess
 import json
 import os
+import shutil
+from pathlib import Path
 
 import steamsync.defs as defs
+from steamsync.runner import CommandRunner
 import steamsync.launchers.launcher as launcher
 
 
+def get_default_config_path():
+    """Get the folder where legendary keeps its state, the same way legendary
+    finds it.
+
+    get_default_config_path() -> str
+    """
+    path = os.environ.get("LEGENDARY_CONFIG_PATH")
+    if path:
+        return path
+    config_home = os.environ.get("XDG_CONFIG_HOME")
+    if config_home:
+        return os.path.join(config_home, "legendary")
+    return os.path.join(os.path.expanduser("~"), ".config", "legendary")
+
+
 class LegendaryLauncher(launcher.Launcher):
     """Support for the Legendary launcher
 
     https://github.com/derrod/legendary"""
 
-    def __init__(self, legendary_command: str = "legendary"):
+    def __init__(
+        self,
+        legendary_command: str = "legendary",
+        config_path: str = None,
+        runner: CommandRunner = None,
+    ):
+        """
+        :config_path: legendary's config folder. None to find it like
+        legendary does.
+        :runner: Runs legendary if we can't read its files.
+        """
         self.legendary_command = legendary_command
+        self.config_path = config_path or get_default_config_path()
+        self.runner = runner or CommandRunner()
 
     def collect_games(self) -> list[defs.GameDefinition]:
-        games_dict = {}
-        # populate info for all installable games
-        games_raw_json = (
-            subprocess.Popen(
-                [self.legendary_command, "list-games", "--json"], stdout=subprocess.PIPE
-            )
-            .communicate()[0]
-            .decode()
-        )
-        games_json = json.loads(games_raw_json)
-        for entry in games_json:
-            # TODO: Map other useful information, like tags?
-            games_dict[entry["app_name"]] = {"art": entry["metadata"]["keyImages"][0]}
+        # Reading legendary's files is much faster than running it, and
+        # list-games may hit the network. Only ask legendary if we can't.
+        installed = self._read_installed_games()
+        if installed is None:
+            installed = self._list_installed_games()
+
         games = list()
-        raw_json = (
-            subprocess.Popen(
-                [self.legendary_command, "list-installed", "--json"],
-                stdout=subprocess.PIPE,
-            )
-            .communicate()[0]
-            .decode()
-        )
-        parsed_json = json.loads(raw_json)
-        for entry in parsed_json:
+        for entry in installed:
             app_name = entry["app_name"]
             launch_args = " launch " + app_name
             display_name = entry["title"]
             install_location = entry["install_path"]
-            art_url = None
             icon = os.path.join(install_location, entry["executable"])
-            if app_name in games_dict:
-                art_url = games_dict[app_name]["art"]
 
             games.append(
                 defs.GameDefinition(
@@ -55,13 +65,108 @@ class LegendaryLauncher(launcher.Launcher):
                     app_name,
                     install_location,
                     launch_args,
-                    art_url,
+                    entry["art_url"],
                     defs.TAG_LEGENDARY,
-                    icon,
+                    icon=icon,
                 )
             )
         return games
 
+    def _read_installed_games(self):
+        """Read installed games and their art from legendary's config folder.
+
+        Returns None if legendary's files aren't there.
+
+        _read_installed_games() -> list[dict]
+        """
+        config = Path(self.config_path)
+        try:
+            with (config / "installed.json").open("r", encoding="utf-8") as f:
+                installed = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        entries = []
+        for entry in installed.values():
+            if entry.get("is_dlc"):
+                # list-installed doesn't list dlc either.
+                continue
+            metadata = {}
+            metadata_fname = config / "metadata" / f"{entry['app_name']}.json"
+            try:
+                with metadata_fname.open("r", encoding="utf-8") as f:
+                    metadata = json.load(f).get("metadata", {})
+            except (OSError, ValueError):
+                pass
+            entries.append(dict(entry, art_url=_get_art_url(metadata)))
+        return entries
+
+    def _list_installed_games(self):
+        """Ask legendary for installed games and their art.
+
+        _list_installed_games() -> list[dict]
+        """
+        fingerprint = self._get_state_fingerprint()
+        games_raw_json, raw_json = self.runner.run_many(
+            [
+                {
+                    "args": [self.legendary_command, "list-games", "--json"],
+                    "fingerprint": fingerprint,
+                    "encoding": "utf-8",
+                },
+                {
+                    "args": [self.legendary_command, "list-installed", "--json"],
+                    "fingerprint": fingerprint,
+                    "encoding": "utf-8",
+                },
+            ]
+        )
+        art_urls = {}
+        # populate info for all installable games
+        games_json = json.loads(games_raw_json)
+        for entry in games_json:
+            # TODO: Map other useful information, like tags?
+            art_urls[entry["app_name"]] = _get_art_url(entry["metadata"])
+        parsed_json = json.loads(raw_json)
+        return [
+            dict(entry, art_url=art_urls.get(entry["app_name"]))
+            for entry in parsed_json
+        ]
+
+    def _get_state_fingerprint(self):
+        """Get something that changes whenever legendary's answers could.
+
+        We only ask legendary when installed.json is missing or broken, so
+        this can't rely on it. Legendary creates its config folder on its
+        first run and adds installed.json there on the first install, so the
+        folder's mtime notices that, and updates to legendary itself might
+        change its output.
+
+        Returns None (don't cache) if we can't find legendary or its config.
+
+        _get_state_fingerprint() -> list
+        """
+        command = shutil.which(self.legendary_command)
+        if not command:
+            return None
+        fingerprint = []
+        for path in [
+            command,
+            self.config_path,
+            os.path.join(self.config_path, "installed.json"),
+        ]:
+            try:
+                stat = os.stat(path)
+                fingerprint.append([stat.st_size, stat.st_mtime_ns])
+            except FileNotFoundError:
+                fingerprint.append(None)
+            except OSError:
+                return None
+        if fingerprint[1] is None:
+            # Legendary keeps its state somewhere else.
+            return None
+        return fingerprint
+
     def get_store_id(self) -> str:
         return defs.TAG_LEGENDARY
 
@@ -69,4 +174,34 @@ class LegendaryLauncher(launcher.Launcher):
         return "legendary"
 
     def is_installed(self) -> bool:
-        return True  # TODO
+        installed_fname = os.path.join(self.config_path, "installed.json")
+        if os.path.isfile(installed_fname):
+            return True
+        # Without installed.json we need to run legendary.
+        return shutil.which(self.legendary_command) is not None
+
+    def get_watch_paths(self) -> list[str]:
+        return [os.path.join(self.config_path, "installed.json")]
+
+    def get_inventory_fingerprint(self):
+        try:
+            stat = os.stat(os.path.join(self.config_path, "installed.json"))
+        except FileNotFoundError:
+            # Legendary writes installed.json on its first install, so
+            # without it there's nothing installed (or legendary isn't).
+            return [self.legendary_command, None]
+        except OSError:
+            # We'd have to ask legendary.
+            return None
+        return [self.legendary_command, stat.st_size, stat.st_mtime_ns]
+
+
+def _get_art_url(metadata):
+    """Get the url of the first image in a game's legendary metadata.
+
+    _get_art_url(dict) -> str
+    """
+    key_images = metadata.get("keyImages")
+    if not key_images:
+        return None
+    return key_images[0].get("url")
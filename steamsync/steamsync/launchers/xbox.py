@@ -2,28 +2,109 @@
 
 # LICENSE: AGPLv3. See LICENSE at root of repo
 
+import abc
 import json
 import os
-import subprocess
+import time
 import xml.parsers.expat
 from pathlib import Path
-from xml.dom import minidom
 
 
 import steamsync.defs as defs
 import steamsync.defs as defssteams
+import steamsync.fsprobe as fsprobe
 import steamsync.util as util
+from steamsync.runner import CommandRunner
 
 import steamsync.launchers.launcher as launcher
 
+k_manifest_cache_fname = "xbox_manifests.json"
+k_manifest_cache_version = 1
+k_xml_chunk_size = 16 * 1024
+k_inventory_cache_fname = "xbox_inventory.json"
+k_inventory_cache_version = 1
+# Refresh even if nothing seems to have changed in case we missed a change.
+k_inventory_max_age = 24 * 60 * 60
 
-class XboxLauncher(launcher.Launcher):
-    def collect_games(self) -> list[defs.GameDefinition]:
-        """Collect a list of "Xbox" games from Microsoft Game Store."""
-        games = []
-        applist = []
 
-        print("\nScanning Xbox library...")
+class _ManifestCache:
+    """
+    Remembers what we read from each package's manifest until the manifest
+    changes, so we don't parse xml for every package on every run
+    """
+
+    def __init__(self, cache_folder):
+        self._fname = None
+        self._entries = {}
+        self._dirty = False
+        if cache_folder:
+            self._fname = Path(cache_folder) / k_manifest_cache_fname
+            self._entries = util.load_json_cache(self._fname, k_manifest_cache_version)
+
+    def get(self, path, parse):
+        """Get parse(path), parsing again only if the file changed.
+
+        get(Path, callable) -> json-compatible value
+        """
+        stat = path.stat()
+        key = str(path)
+        entry = self._entries.get(key)
+        if (
+            entry
+            and entry["parser"] == parse.__name__
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            return entry["details"]
+        details = parse(path)
+        self._entries[key] = {
+            "parser": parse.__name__,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "details": details,
+        }
+        self._dirty = True
+        return details
+
+    def save(self):
+        if self._fname and self._dirty:
+            util.save_json_cache(self._fname, k_manifest_cache_version, self._entries)
+            self._dirty = False
+
+
+class XboxInventory(abc.ABC):
+    """Source of the installed packages that might be Xbox games.
+
+    Packages are dicts with the fields list_xbox_games.ps1 outputs: Kind,
+    Appid, PrettyName, Icon, InstallLocation, and Aumid.
+    """
+
+    @abc.abstractmethod
+    def list_packages(self) -> list[dict]:
+        """Return all of the installed packages"""
+        return []
+
+    def get_fingerprint(self, packages):
+        """Return a json-compatible value that changes when the installed
+        packages change, or None if we can't tell.
+
+        packages is the last list_packages result.
+        """
+        return None
+
+    def get_last_packages(self):
+        """Return the packages without asking Windows, or None if we'd have
+        to."""
+        return None
+
+
+class PowerShellInventory(XboxInventory):
+    """Asks Windows for the installed packages with list_xbox_games.ps1"""
+
+    def __init__(self, runner: CommandRunner = None):
+        self.runner = runner or CommandRunner()
+
+    def list_packages(self) -> list[dict]:
         # Run string instead of scriptfile to circumvent powershell ExecutionPolicy
         # ("cannot be loaded because running scripts is disabled on this system").
         script_path = os.path.join(
@@ -32,15 +113,139 @@ class XboxLauncher(launcher.Launcher):
         with open(script_path, "r", encoding="utf-8") as f:
             script_code = "".join(f.readlines())
         try:
-            output = subprocess.check_output(
-                ["powershell.exe", str(script_code)], universal_newlines=True
-            )
-            applist = json.loads(output)
+            output = self.runner.run(["powershell.exe", str(script_code)])
         except FileNotFoundError as e:
             print(
                 "Couldn't find PowerShell executable, skipping collecting Xbox games."
             )
             raise e
+        return _parse_package_list(output)
+
+    def get_fingerprint(self, packages):
+        # Installing, updating, or removing a package adds or removes entries
+        # in these folders, which changes their mtime. We can stat
+        # WindowsApps even though we aren't allowed to list it.
+        program_files = os.environ.get("ProgramFiles", "C:\\Program Files")
+        program_data = os.environ.get("ProgramData", "C:\\ProgramData")
+        app_repository = os.path.join(
+            program_data, "Microsoft", "Windows", "AppRepository"
+        )
+        folders = {
+            os.path.join(program_files, "WindowsApps"),
+            app_repository,
+            os.path.join(app_repository, "Packages"),
+        }
+        local_app_data = os.environ.get("LOCALAPPDATA")
+        if local_app_data:
+            folders.add(os.path.join(local_app_data, "Packages"))
+        # Games can be installed to other drives (D:\XboxGames).
+        folders.update(os.path.dirname(p["InstallLocation"]) for p in packages)
+
+        fingerprint = []
+        for folder in sorted(folders):
+            try:
+                fingerprint.append([folder, os.stat(folder).st_mtime_ns])
+            except OSError:
+                pass
+        return fingerprint or None
+
+
+class FileInventory(XboxInventory):
+    """Reads packages from a json file in list_xbox_games.ps1's format.
+
+    Lets us test the Xbox launcher without PowerShell.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def list_packages(self) -> list[dict]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return _parse_package_list(f.read())
+
+    def get_fingerprint(self, packages):
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get_last_packages(self):
+        return self.list_packages()
+
+
+class CachedInventory(XboxInventory):
+    """Remembers another inventory's packages until its fingerprint changes
+    or they're too old"""
+
+    def __init__(
+        self, source: XboxInventory, cache_folder: str, max_age=k_inventory_max_age
+    ):
+        self.source = source
+        self.fname = Path(cache_folder) / k_inventory_cache_fname
+        self.max_age = max_age
+
+    def list_packages(self) -> list[dict]:
+        cache = util.load_json_cache(self.fname, k_inventory_cache_version)
+        if cache:
+            packages = cache["packages"]
+            age = time.time() - cache["timestamp"]
+            fingerprint = self.source.get_fingerprint(packages)
+            if (
+                fingerprint is not None
+                and fingerprint == cache["fingerprint"]
+                and 0 <= age < self.max_age
+            ):
+                return packages
+
+        packages = self.source.list_packages()
+        util.save_json_cache(
+            self.fname,
+            k_inventory_cache_version,
+            {
+                "packages": packages,
+                "fingerprint": self.source.get_fingerprint(packages),
+                "timestamp": time.time(),
+            },
+        )
+        return packages
+
+    def get_fingerprint(self, packages):
+        return self.source.get_fingerprint(packages)
+
+    def get_last_packages(self):
+        cache = util.load_json_cache(self.fname, k_inventory_cache_version)
+        if not cache:
+            return None
+        return cache["packages"]
+
+
+class XboxLauncher(launcher.Launcher):
+    def __init__(
+        self,
+        cache_folder: str = None,
+        inventory: XboxInventory = None,
+        runner: CommandRunner = None,
+    ):
+        """
+        :cache_folder: Where to remember the installed packages and what we
+        read from their manifests. None to ask Windows and read them every
+        time.
+        :inventory: Where to get installed packages. Defaults to asking
+        PowerShell.
+        :runner: Runs PowerShell for the default inventory.
+        """
+        self.cache_folder = cache_folder
+        if not inventory:
+            inventory = PowerShellInventory(runner)
+            if cache_folder:
+                inventory = CachedInventory(inventory, cache_folder)
+        self.inventory = inventory
+
+    def collect_games(self) -> list[defs.GameDefinition]:
+        """Collect a list of "Xbox" games from Microsoft Game Store."""
+        games = []
+        manifests = _ManifestCache(self.cache_folder)
+
+        print("\nScanning Xbox library...")
+        applist = self.inventory.list_packages()
 
         for app in applist:
             args = ""
@@ -51,7 +256,8 @@ class XboxLauncher(launcher.Launcher):
             # MicrosoftGame.config.
             config = install / "MicrosoftGame.config"
             if config.is_file():
-                exe_name, game_name = _get_details_from_config(config)
+                exe_name, display_name = manifests.get(config, _get_details_from_config)
+                game_name = display_name or game_name
             else:
                 is_game = app["Kind"] == "Game"
                 if is_game:
@@ -69,7 +275,9 @@ class XboxLauncher(launcher.Launcher):
                     )
                     continue
 
-                if not is_game and not _is_game_judging_by_manifest(config):
+                if not is_game and not manifests.get(
+                    config, _is_game_judging_by_manifest
+                ):
                     continue
 
                 # We have a game, but don't have an exe path (an older game).
@@ -81,7 +289,7 @@ class XboxLauncher(launcher.Launcher):
                 # migration to uri-based launching.
                 exe = install / exe_name
 
-                if not exe.is_file():
+                if not fsprobe.get_probe().is_file(exe):
                     print(
                         f"Warning: Failed to find exe for game '{game_name}'. Expected: {exe}"
                     )
@@ -118,6 +326,7 @@ class XboxLauncher(launcher.Launcher):
             game_def.icon = str(icon)
             games.append(game_def)
 
+        manifests.save()
         print(f"Collected {len(games)} games from the Xbox library")
         games.sort()
         return games
@@ -131,61 +340,161 @@ class XboxLauncher(launcher.Launcher):
     def is_installed(self) -> bool:
         return True  # techinically installed for every windows PC
 
+    def get_inventory_fingerprint(self):
+        # The fingerprint covers the drives games were installed to, which
+        # we only know from the last package list.
+        packages = self.inventory.get_last_packages()
+        if packages is None:
+            return None
+        return self.inventory.get_fingerprint(packages)
+
+
+def _parse_package_list(output):
+    """Parse list_xbox_games.ps1's json output.
+
+    ConvertTo-Json writes a lone object instead of a list when there's one
+    package, and nothing at all when there are none.
+
+    _parse_package_list(str) -> list[dict]
+    """
+    if not output.strip():
+        return []
+    packages = json.loads(output)
+    if isinstance(packages, dict):
+        packages = [packages]
+    return packages
+
+
+class _StopParsing(Exception):
+    """Raised from expat handlers once we've read everything we need."""
+
+
+def _stream_xml(path, parser, errors="strict"):
+    """Feed the file at path to an expat parser until it's done or one of its
+    handlers raises _StopParsing.
+
+    Manifests can be big, but we only need a few things near the top of
+    most of them, so we don't read further than necessary.
+
+    _stream_xml(Path, xmlparser, str) -> None
+    """
+    with path.open("r", encoding="utf-8", errors=errors) as f:
+        try:
+            while True:
+                chunk = f.read(k_xml_chunk_size)
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+        except _StopParsing:
+            pass
+
 
 def _get_details_from_config(path_to_config):
-    """Get the exe file name (not full path) to launch from the config.
+    """Get the exe file name (not full path) to launch and the display name
+    from the config.
+
+    Either might be None if the config doesn't have them.
 
     _get_details_from_config(Path) -> str,str
     """
-    with path_to_config.open("r", encoding="utf-8") as f:
-        doc = minidom.parse(f)
-    # "Tetris® Effect: Connected" instead of "Tetrisr Effect: Connected" from list_xbox_games.
-    display_name = doc.getElementsByTagName("ShellVisuals")[0].getAttribute(
-        "DefaultDisplayName"
-    )
-    exes = doc.getElementsByTagName("Executable")
-    for exe in exes:
-        return exe.getAttribute("Name"), display_name
+    details = {}
 
+    def start_element(name, attrs):
+        if name == "ShellVisuals" and "display_name" not in details:
+            details["display_name"] = attrs.get("DefaultDisplayName", "")
+        elif name == "Executable" and "exe_name" not in details:
+            details["exe_name"] = attrs.get("Name", "")
+        if len(details) == 2:
+            raise _StopParsing()
 
-def _is_game_judging_by_manifest(path_to_manifest):
-    """Determine if app looks like a game from its AppxManifest.
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    _stream_xml(path_to_config, parser)
+    # "Tetris® Effect: Connected" instead of "Tetrisr Effect: Connected" from list_xbox_games.
+    return details.get("exe_name"), details.get("display_name")
 
-    _is_game_judging_by_manifest(Path) -> bool
+
+class _AppxManifestScan:
     """
-    with path_to_manifest.open("r", encoding="utf-8", errors="ignore") as f:
-        try:
-            doc = minidom.parse(f)
-        except xml.parsers.expat.ExpatError as e:
-            # If unparsable, then it failed to tell us it's a game.
-            print(f"Failed to parse manifest and assuming not a game: '{path_to_manifest.as_posix()}'")
+    Collects what _is_game_judging_by_manifest needs from an AppxManifest
+    and stops the parser as soon as the answer can't change
+    """
+
+    def __init__(self):
+        self.is_xbox_app = False
+        self.families = []
+        self.has_game_library = False
+        self.exe_name = None
+        self.dependencies_done = False
+        self.applications_done = False
+        self._path_text = None
+
+    def attach(self, parser):
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.character_data
+
+    def start_element(self, name, attrs):
+        if name == "uap:VisualElements":
+            if "xbox" in attrs.get("DisplayName", "").lower():
+                self.is_xbox_app = True
+                raise _StopParsing()
+        elif name == "TargetDeviceFamily":
+            self.families.append(attrs.get("Name", "").lower())
+        elif name == "Application":
+            if self.exe_name is None:
+                self.exe_name = attrs.get("Executable", "")
+        elif name == "Path":
+            self._path_text = []
+
+    def end_element(self, name):
+        if name == "Path":
+            lib = "".join(self._path_text)
+            self._path_text = None
+            if lib in ["Microsoft.Xbox.Services.dll", "UnityPlayer.dll"]:
+                self.has_game_library = True
+        elif name == "Dependencies":
+            self.dependencies_done = True
+            if "windows.desktop" not in self.families:
+                raise _StopParsing()
+        elif name == "Applications":
+            self.applications_done = True
+
+        if self.has_game_library and self.dependencies_done and self.applications_done:
+            raise _StopParsing()
+
+    def character_data(self, data):
+        if self._path_text is not None:
+            self._path_text.append(data)
+
+    def is_game(self):
+        # Exclude Xbox apps which may otherwise look like a game
+        if self.is_xbox_app:
+            return None
+        # Exclude non-desktop apps
+        if "windows.desktop" not in self.families:
             return None
+        # Assume anything using Unity or Xbox are a game.
+        if not self.has_game_library:
+            # Run out of ways to determine if this is a game, so assume not.
+            return None
+        if self.exe_name is None:
+            return None
+        return self.exe_name and not self.exe_name.isspace()
 
-    # Exclude Xbox apps which may otherwise look like a game
-    name = [
-        e.getAttribute("DisplayName").lower()
-        for e in doc.getElementsByTagName("uap:VisualElements")
-    ]
-    if any(e for e in name if "xbox" in e):
-        return None
 
-    # Exclude non-desktop apps
-    family = [
-        e.getAttribute("Name").lower()
-        for e in doc.getElementsByTagName("TargetDeviceFamily")
-    ]
-    if "windows.desktop" not in family:
-        return None
+def _is_game_judging_by_manifest(path_to_manifest):
+    """Determine if app looks like a game from its AppxManifest.
 
-    # Assume anything using Unity or Xbox are a game.
-    libs = [e.firstChild.nodeValue for e in doc.getElementsByTagName("Path")]
-    game_services = "Microsoft.Xbox.Services.dll" in libs
-    unity_game = "UnityPlayer.dll" in libs
-    if not game_services and not unity_game:
-        # Run out of ways to determine if this is a game, so assume not.
-        # print(f"App determined to be not game {path_to_manifest.parent.name}")
+    _is_game_judging_by_manifest(Path) -> bool
+    """
+    scan = _AppxManifestScan()
+    parser = xml.parsers.expat.ParserCreate()
+    scan.attach(parser)
+    try:
+        _stream_xml(path_to_manifest, parser, errors="ignore")
+    except xml.parsers.expat.ExpatError as e:
+        # If unparsable, then it failed to tell us it's a game.
+        print(f"Failed to parse manifest and assuming not a game: '{path_to_manifest.as_posix()}'")
         return None
-    exes = doc.getElementsByTagName("Application")
-    for exe in exes:
-        exe_name = exe.getAttribute("Executable")
-        return exe_name and not exe_name.isspace()
+    return scan.is_game()
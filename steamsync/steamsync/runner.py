@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+import hashlib
+import json
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import steamsync.util as util
+
+k_default_timeout = 60
+k_cache_fname = "commands.json"
+k_cache_version = 1
+k_cache_max_age = 24 * 60 * 60
+k_timing_command_length = 60
+
+
+class CommandError(Exception):
+    """A command timed out or failed."""
+
+
+class CommandTiming:
+    """
+    Data class for how long a command took
+    """
+
+    def __init__(self, args, seconds, cached):
+        self.args = args
+        self.seconds = seconds
+        self.cached = cached
+
+    def __str__(self):
+        command = " ".join(self.args)
+        if len(command) > k_timing_command_length:
+            # Scripts are passed as arguments, so only show the start.
+            command = command[: k_timing_command_length - 3] + "..."
+        took = "cached" if self.cached else f"{self.seconds:.2f}s"
+        return f"{command}: {took}"
+
+
+class CommandRunner:
+    """
+    Runs the external programs that launchers ask for games
+
+    Every command gets a timeout and its stdin closed so it can't wait
+    forever on a prompt. Results can be cached between runs, and every run
+    is timed.
+    """
+
+    def __init__(self, timeout=k_default_timeout, cache_folder=None):
+        """
+        :timeout: Default seconds to wait for a command before giving up.
+        :cache_folder: Where to remember output of commands run with a
+        fingerprint. None to never cache.
+        """
+        self.timeout = timeout
+        self._cache_fname = None
+        if cache_folder:
+            self._cache_fname = Path(cache_folder) / k_cache_fname
+        self._cache = None
+        self._lock = threading.Lock()
+        self.timings = []
+
+    def run(self, args, input=None, timeout=None, fingerprint=None, encoding=None):
+        """Run a command and return its output.
+
+        If fingerprint is given, output from a previous run of the same
+        command with the same input and fingerprint is reused (for up to a
+        day). Pass something that changes whenever the command's output
+        would, like the mtime of the files it reads.
+
+        Raises CommandError if the command times out or fails, and
+        FileNotFoundError if the program doesn't exist.
+
+        run(list[str], str, float, json-compatible, str) -> str
+        """
+        args = [str(a) for a in args]
+        key = None
+        if fingerprint is not None and self._cache_fname:
+            key = self._get_cache_key(args, input, fingerprint)
+            output = self._get_cached(key)
+            if output is not None:
+                self._add_timing(CommandTiming(args, 0, True))
+                return output
+
+        if timeout is None:
+            timeout = self.timeout
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(
+                args,
+                input=input,
+                stdin=None if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                timeout=timeout,
+                text=True,
+                encoding=encoding,
+                errors="replace",
+            )
+        except subprocess.TimeoutExpired as e:
+            raise CommandError(f"'{args[0]}' didn't finish within {timeout:g}s") from e
+        finally:
+            self._add_timing(CommandTiming(args, time.perf_counter() - start, False))
+
+        if result.returncode != 0:
+            raise CommandError(f"'{args[0]}' failed with exit code {result.returncode}")
+
+        if key:
+            self._set_cached(key, result.stdout)
+        return result.stdout
+
+    def run_many(self, commands):
+        """Run independent commands at the same time.
+
+        Each command is a dict of keyword arguments for run. Returns their
+        outputs in the same order, or raises the first command's error.
+
+        run_many(list[dict]) -> list[str]
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(commands))) as pool:
+            futures = [pool.submit(self.run, **command) for command in commands]
+            return [f.result() for f in futures]
+
+    def _add_timing(self, timing):
+        with self._lock:
+            self.timings.append(timing)
+
+    def _get_cache_key(self, args, input, fingerprint):
+        data = json.dumps([args, input, fingerprint], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key):
+        with self._lock:
+            if self._cache is None:
+                self._cache = util.load_json_cache(self._cache_fname, k_cache_version)
+            entry = self._cache.get(key)
+        if entry and 0 <= time.time() - entry["timestamp"] < k_cache_max_age:
+            return entry["output"]
+        return None
+
+    def _set_cached(self, key, output):
+        with self._lock:
+            now = time.time()
+            # Drop old entries so commands we stopped running don't pile up.
+            self._cache = {
+                k: v
+                for k, v in self._cache.items()
+                if now - v["timestamp"] < k_cache_max_age
+            }
+            self._cache[key] = {"output": output, "timestamp": now}
+            util.save_json_cache(self._cache_fname, k_cache_version, self._cache)
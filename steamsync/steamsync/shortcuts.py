@@ -0,0 +1,388 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Read and write Steam's binary shortcuts.vdf.
+
+Produces and accepts the same objects as vdf.binary_loads/binary_dumps,
+but is faster on big files. Strings are decoded with surrogateescape so
+bytes that aren't valid utf-8 survive a load and dump unchanged.
+"""
+
+import os
+import struct
+from collections.abc import Mapping
+
+import vdf
+
+k_type_map = 0x00
+k_type_string = 0x01
+k_type_int32 = 0x02
+k_type_float32 = 0x03
+k_type_pointer = 0x04
+k_type_widestring = 0x05
+k_type_color = 0x06
+k_type_uint64 = 0x07
+k_type_end = 0x08
+k_type_int64 = 0x0A
+
+_int32 = struct.Struct("<i")
+_uint64 = struct.Struct("<Q")
+_int64 = struct.Struct("<q")
+_float32 = struct.Struct("<f")
+
+
+class WideString(str):
+    """A string stored as utf-16 in the file. Kept as a separate type so it's
+    written back the same way."""
+
+
+def load(fp):
+    """Load shortcuts from a binary file object.
+
+    load(file) -> dict
+    """
+    return loads(fp.read())
+
+
+def loads(data):
+    """Load shortcuts from bytes (or anything with the buffer protocol).
+
+    Numbers are unpacked straight out of data and only the strings are
+    sliced out to decode them, instead of reading the file in small chunks
+    like vdf.
+
+    loads(bytes) -> dict
+    """
+    # Need find(), so anything that isn't bytes-like gets one copy.
+    buf = data if hasattr(data, "find") else bytes(data)
+    find = buf.find
+    size = len(buf)
+    unpack_int32 = _int32.unpack_from
+
+    stack = [{}]
+    current = stack[0]
+    pos = 0
+    # Ordered by how common each type is in shortcuts.vdf.
+    while pos < size:
+        t = buf[pos]
+        if t == k_type_end:
+            pos += 1
+            if len(stack) > 1:
+                stack.pop()
+                current = stack[-1]
+                continue
+            break
+
+        end = find(b"\x00", pos + 1)
+        if end < 0:
+            raise SyntaxError(f"Unterminated cstring (offset: {pos + 1})")
+        key = buf[pos + 1 : end].decode("utf-8", "surrogateescape")
+        pos = end + 1
+
+        if t == k_type_string:
+            end = find(b"\x00", pos)
+            if end < 0:
+                raise SyntaxError(f"Unterminated cstring (offset: {pos})")
+            current[key] = buf[pos:end].decode("utf-8", "surrogateescape")
+            pos = end + 1
+        elif t == k_type_int32:
+            current[key] = unpack_int32(buf, pos)[0]
+            pos += 4
+        elif t == k_type_map:
+            child = current.get(key)
+            if not isinstance(child, dict):
+                # Like vdf, merge duplicate maps.
+                child = current[key] = {}
+            stack.append(child)
+            current = child
+        elif t == k_type_float32:
+            current[key] = _float32.unpack_from(buf, pos)[0]
+            pos += 4
+        elif t == k_type_pointer:
+            current[key] = vdf.POINTER(_int32.unpack_from(buf, pos)[0])
+            pos += 4
+        elif t == k_type_color:
+            current[key] = vdf.COLOR(_int32.unpack_from(buf, pos)[0])
+            pos += 4
+        elif t == k_type_uint64:
+            current[key] = vdf.UINT_64(_uint64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif t == k_type_int64:
+            current[key] = vdf.INT_64(_int64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif t == k_type_widestring:
+            end = find(b"\x00\x00", pos)
+            while end >= 0 and (end - pos) % 2:
+                end = find(b"\x00\x00", end + 1)
+            if end < 0:
+                raise SyntaxError(f"Unterminated wide cstring (offset: {pos})")
+            current[key] = WideString(buf[pos:end].decode("utf-16-le"))
+            pos = end + 2
+        else:
+            raise SyntaxError(f"Unknown data type at offset {pos - 1}: {t!r}")
+
+    if len(stack) != 1:
+        raise SyntaxError("Reached EOF, but Binary VDF is incomplete")
+    return stack[0]
+
+
+def dump(obj, fp):
+    """Write shortcuts to a binary file object.
+
+    dump(dict, file) -> None
+    """
+    fp.write(dumps(obj))
+
+
+def dumps(obj):
+    """Serialize shortcuts to bytes.
+
+    Encodes every item into a list of pieces and joins them once, so the
+    output is copied into a single buffer of the right size.
+
+    dumps(dict) -> bytes
+    """
+    if not obj:
+        return b""
+    pieces = []
+    _dump_map(obj, pieces, {})
+    return b"".join(pieces)
+
+
+def _dump_map(obj, pieces, prefixes):
+    """Append the encoded items of obj (and its children) to pieces.
+
+    Every shortcut has the same keys, so the type, key, and terminator
+    that start each item are encoded once and kept in prefixes.
+
+    _dump_map(Mapping, list[bytes], dict) -> None
+    """
+    append = pieces.append
+    for key, value in obj.items():
+        # Exact type checks first since they're the common case and
+        # subclasses of int (COLOR, POINTER, ...) are stored differently.
+        value_type = type(value)
+        if value_type is str:
+            t = k_type_string
+            value = value.encode("utf-8", "surrogateescape") + b"\x00"
+        elif value_type is int:
+            t = k_type_int32
+            value = _int32.pack(value)
+        elif isinstance(value, Mapping):
+            t = k_type_map
+        elif isinstance(value, vdf.UINT_64):
+            t = k_type_uint64
+            value = _uint64.pack(value)
+        elif isinstance(value, vdf.INT_64):
+            t = k_type_int64
+            value = _int64.pack(value)
+        elif isinstance(value, WideString):
+            t = k_type_widestring
+            value = value.encode("utf-16-le") + b"\x00\x00"
+        elif isinstance(value, str):
+            t = k_type_string
+            value = value.encode("utf-8", "surrogateescape") + b"\x00"
+        elif isinstance(value, float):
+            t = k_type_float32
+            value = _float32.pack(value)
+        elif isinstance(value, vdf.COLOR):
+            t = k_type_color
+            value = _int32.pack(value)
+        elif isinstance(value, vdf.POINTER):
+            t = k_type_pointer
+            value = _int32.pack(value)
+        elif isinstance(value, int):
+            t = k_type_int32
+            value = _int32.pack(value)
+        else:
+            raise TypeError(f"Unsupported type: {type(value)}")
+
+        prefix = prefixes.get((t, key))
+        if prefix is None:
+            if not isinstance(key, str):
+                raise TypeError(f"dict keys must be of type str, got {type(key)}")
+            prefix = bytes([t]) + key.encode("utf-8", "surrogateescape") + b"\x00"
+            prefixes[(t, key)] = prefix
+        append(prefix)
+        if t == k_type_map:
+            _dump_map(value, pieces, prefixes)
+        else:
+            append(value)
+    append(bytes([k_type_end]))
+
+
+def get_exe(shortcut):
+    """Get the exe of a shortcut. Steam has used both Exe and exe.
+
+    get_exe(dict) -> str
+    """
+    exe = shortcut.get("Exe")
+    if not exe:
+        exe = shortcut.get("exe")
+    # May return None
+    return exe
+
+
+def normalise_path(path):
+    """Make paths to the same file compare equal.
+
+    Manually added shortcuts may have additional quotes, and Windows paths
+    aren't case sensitive.
+
+    normalise_path(str) -> str
+    """
+    return os.path.normcase(path.strip('"'))
+
+
+def is_uri_shortcut(exe):
+    """Does a shortcut launch through a uri instead of running an exe?
+
+    is_uri_shortcut(str) -> bool
+    """
+    return "://" in exe or exe.lower().endswith("explorer.exe")
+
+
+def get_uris(shortcut):
+    """Get the uris that identify the game a shortcut launches.
+
+    get_uris(dict) -> list[str]
+    """
+    exe = get_exe(shortcut)
+    if not exe or not is_uri_shortcut(exe):
+        return []
+    if "://" in exe:
+        return [exe]  # epic uri
+    # explorer.exe launches the xbox uri in its args.
+    launch_args = shortcut.get("LaunchOptions", "")
+    return [launch_args] if launch_args else []
+
+
+class ShortcutIndex:
+    """
+    The shortcuts from a loaded shortcuts.vdf with lookups by the ways we
+    identify a game, so reconciling games with shortcuts is linear
+
+    Change shortcuts through the index to keep its lookups up to date.
+    """
+
+    def __init__(self, shortcut_file):
+        """
+        :shortcut_file: Loaded shortcuts.vdf ({"shortcuts": {index: shortcut}}).
+        """
+        self.shortcut_file = shortcut_file
+        self._rebuild()
+
+    def _rebuild(self):
+        self._by_key = {}
+        self._by_uri = {}
+        self._by_path = {}
+        self._last_index = 0
+        for index, shortcut in self.get_shortcuts().items():
+            self._add_to_lookups(index, shortcut)
+            self._last_index = max(self._last_index, int(index))
+
+    def _get_lookup_keys(self, shortcut):
+        """Get the lookups a shortcut belongs in and its key in each.
+
+        _get_lookup_keys(dict) -> list[(dict,str)]
+        """
+        exe = get_exe(shortcut)
+        if not exe:
+            return []
+        launch_args = shortcut.get("LaunchOptions", "")
+        # Include args to handle mulitple explorer.exe options for xbox.
+        keys = [(self._by_key, f"{exe}|{launch_args}")]
+        if is_uri_shortcut(exe):
+            keys += [(self._by_uri, uri) for uri in get_uris(shortcut)]
+        else:
+            # Args tell apart games run by the same exe (like legendary).
+            keys.append((self._by_path, f"{normalise_path(exe)}|{launch_args}"))
+        return keys
+
+    def _add_to_lookups(self, index, shortcut):
+        # Later shortcuts win when they collide.
+        for lookup, key in self._get_lookup_keys(shortcut):
+            lookup[key] = index
+
+    def _remove_from_lookups(self, index, shortcut):
+        for lookup, key in self._get_lookup_keys(shortcut):
+            if lookup.get(key) == index:
+                del lookup[key]
+
+    def get_shortcuts(self):
+        """Get the shortcuts by their index.
+
+        get_shortcuts() -> dict[str,dict]
+        """
+        return self.shortcut_file["shortcuts"]
+
+    def find_by_key(self, exe, launch_args):
+        """Get the index of the shortcut that runs exe with launch_args.
+
+        find_by_key(str, str) -> str
+        """
+        return self._by_key.get(f"{exe}|{launch_args}")
+
+    def find_by_uri(self, uri):
+        """Get the index of a shortcut that launches uri.
+
+        find_by_uri(str) -> str
+        """
+        return self._by_uri.get(uri)
+
+    def find_by_path(self, path, launch_args):
+        """Get the index of a shortcut that runs the exe at path with
+        launch_args, however the path is quoted or (on Windows) cased.
+
+        find_by_path(str, str) -> str
+        """
+        return self._by_path.get(f"{normalise_path(path)}|{launch_args}")
+
+    def find(self, exe, launch_args):
+        """Get the index of the shortcut that launches the same thing as exe
+        with launch_args.
+
+        find(str, str) -> str
+        """
+        index = self.find_by_key(exe, launch_args)
+        if index:
+            return index
+        if not is_uri_shortcut(exe):
+            return self.find_by_path(exe, launch_args)
+        for uri in get_uris({"Exe": exe, "LaunchOptions": launch_args}):
+            index = self.find_by_uri(uri)
+            if index:
+                return index
+        return None
+
+    def add(self, shortcut):
+        """Add a shortcut after all of the others.
+
+        add(dict) -> str
+        """
+        self._last_index += 1
+        index = str(self._last_index)
+        self.get_shortcuts()[index] = shortcut
+        self._add_to_lookups(index, shortcut)
+        return index
+
+    def replace(self, index, shortcut):
+        """Replace the shortcut at index.
+
+        replace(str, dict) -> None
+        """
+        shortcuts = self.get_shortcuts()
+        self._remove_from_lookups(index, shortcuts[index])
+        shortcuts[index] = shortcut
+        self._add_to_lookups(index, shortcut)
+
+    def keep_only(self, shortcuts):
+        """Remove every shortcut that isn't in the input list. Renumbers the
+        remaining ones in order.
+
+        keep_only(list[dict]) -> None
+        """
+        self.shortcut_file["shortcuts"] = {
+            str(i): shortcut for i, shortcut in enumerate(shortcuts)
+        }
+        self._rebuild()
@@ -2,46 +2,37 @@
 
 # LICENSE: AGPLv3. See LICENSE at root of repo
 
-import json
 import os
 import re
 import sys
 import shutil
-import unicodedata
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 import vdf
 
-k_applist_fname = "applist.json"
-re_remove_hyphen = re.compile(r"- ")
-re_remove_subtitle = re.compile(r"\s*:.*")
-re_remove_braces = re.compile(r"\s*\(.*\)")
-re_remove_pc = re.compile(r"[ _](pc|for windows|windows)$")
-
-
-def _strip_nonascii(text):
-    """Remove non-ascii character to make for easier comparisons.
-
-    _strip_nonascii(str) -> str
-    """
-    stripped = text.encode("ascii", "ignore")
-    return stripped.decode().strip()
-
-
-def _remove_accents(text):
-    """Takes a unicode string and omits characters that would combine with the
-    previous one (diacritics).
-    See https://stackoverflow.com/a/517974/79125
-    """
-    nfkd_form = unicodedata.normalize("NFKD", text)
-    return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-
+import steamsync.applist as applist
+import steamsync.artstore as artstore
+import steamsync.util as util
 
-def _remove_punctuation(text):
-    """Remove punctuation character to make for easier comparisons."""
-    return re.sub(r"[:;,.=+?]", "", text)
+# Only used to migrate to the AppList database.
+k_applist_fname = "applist.json"
+# Only used to clean up validators we used to keep in grid folders.
+k_art_validators_fname = "steamsync_art.json"
+k_art_folder = "art"
+k_account_names_fname = "steam_accounts.json"
+k_account_names_version = 1
+# SteamID64 of account 0. userdata folders are named by the account id.
+k_steamid64_base = 76561197960265728
+k_http_timeout = 30
+k_resolutions_fname = "appid_resolutions.json"
+k_resolutions_version = 1
+# Store names rarely change, but Steam's catalogue grows, so forget names we
+# couldn't find sooner than names we did.
+k_resolution_hit_age = 90 * 24 * 60 * 60
+k_resolution_miss_age = 7 * 24 * 60 * 60
 
 
 class SteamAccount:
@@ -65,25 +56,216 @@ class SteamAccount:
         )
 
 
+def _make_session(pool_size):
+    """Create a requests session that keeps connections alive and can serve
+    pool_size concurrent requests to the same host.
+
+    _make_session(int) -> requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _read_login_users(steam_path):
+    """Read the persona names of accounts that signed in on this machine
+    from Steam's loginusers.vdf.
+
+    Returns a dict of account id (like userdata folder names) to persona
+    name, which is empty if the file is missing or broken.
+
+    _read_login_users(Path) -> dict
+    """
+    try:
+        fname = steam_path / "config/loginusers.vdf"
+        with open(fname, "r", encoding="utf-8", errors="replace") as f:
+            users = vdf.load(f).get("users", {})
+    except (OSError, SyntaxError):
+        return {}
+
+    names = {}
+    for steamid64, info in users.items():
+        if steamid64.isdigit() and isinstance(info, dict) and info.get("PersonaName"):
+            names[str(int(steamid64) - k_steamid64_base)] = info["PersonaName"]
+    return names
+
+
+# A quoted string, a brace, a comment, an unquoted word, or the start of a
+# string that continues on the next line.
+_vdf_token_re = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])|//[^\n]*|([^\s{}"]+)|(")')
+_vdf_escape_re = re.compile(r"\\(.)")
+_vdf_escapes = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def _iter_vdf_tokens(f):
+    """Yield the strings and braces in a text vdf file without reading all
+    of it. Each is paired with whether it's a brace, so a "{" string isn't
+    mistaken for one.
+
+    _iter_vdf_tokens(file) -> iterator[(str, bool)]
+    """
+    pending = ""
+    for line in f:
+        text = pending + line
+        pending = ""
+        for m in _vdf_token_re.finditer(text):
+            quoted, brace, word, partial = m.groups()
+            if partial:
+                pending = text[m.start() :]
+                break
+            if brace:
+                yield brace, True
+            elif quoted is not None:
+                yield _vdf_escape_re.sub(
+                    lambda e: _vdf_escapes.get(e[1], e[1]), quoted
+                ), False
+            elif word is not None:
+                yield word, False
+
+
+def _read_persona_name(localconfig_file):
+    """Find the user's persona name in their localconfig.vdf.
+
+    Stops reading at the first friends.PersonaName, so we don't parse the
+    whole file (it can be many megabytes).
+
+    _read_persona_name(str) -> str
+    """
+    # here we just replace any malformed characters since we are only doing this to get the
+    # display name
+    with open(localconfig_file, "r", encoding="utf-8", errors="replace") as f:
+        path = []
+        key = None
+        for token, is_brace in _iter_vdf_tokens(f):
+            if is_brace:
+                if token == "{":
+                    path.append(key)
+                elif path:
+                    path.pop()
+                key = None
+            elif key is None:
+                key = token
+            else:
+                # Some users have Friends, some have friends, and some are friendless
+                if (
+                    key == "PersonaName"
+                    and len(path) == 2
+                    and path[1] in ("friends", "Friends")
+                ):
+                    return token
+                key = None
+    return None
+
+
+class _AppidResolutions:
+    """
+    Remembers which appid (or that no appid) we found for each game name, so
+    later runs don't have to search the app list again
+    """
+
+    def __init__(self, fname, fuzzy_match_threshold):
+        self._fname = fname
+        self._fuzzy_match_threshold = fuzzy_match_threshold
+        self._entries = None
+        self._dirty = False
+
+    def _get_key(self, name, storetag):
+        return f"{storetag or ''}:{applist.make_gamename_comparable(name)}"
+
+    def get(self, name, storetag):
+        """Get the cached resolution for name.
+
+        Returns whether the name is cached and the appid it resolved to
+        (None for a cached miss).
+
+        get(str, str) -> (bool, int)
+        """
+        if self._entries is None:
+            self._entries = util.load_json_cache(self._fname, k_resolutions_version)
+        entry = self._entries.get(self._get_key(name, storetag))
+        if not entry or entry["threshold"] != self._fuzzy_match_threshold:
+            return False, None
+        max_age = k_resolution_hit_age if entry["appid"] else k_resolution_miss_age
+        if time.time() - entry["timestamp"] > max_age:
+            return False, None
+        return True, entry["appid"]
+
+    def set(self, name, storetag, appid):
+        self._entries[self._get_key(name, storetag)] = {
+            "appid": appid,
+            "threshold": self._fuzzy_match_threshold,
+            "timestamp": time.time(),
+        }
+        self._dirty = True
+
+    def save(self):
+        if self._dirty:
+            util.save_json_cache(self._fname, k_resolutions_version, self._entries)
+            self._dirty = False
+
+
+class _ArtJob:
+    """
+    Tracks the art downloads and results for one game while
+    _download_art_concurrently is running
+    """
+
+    def __init__(self, game, targets):
+        self.game = game
+        self.targets = targets
+        self.expected_art = len(targets)
+        self.found_art = 0
+        self.downloaded_art = False
+        # Art that failed in a way that might work next time.
+        self.failed_art = 0
+        self.logs = []
+        # kind -> Future of _try_download_image
+        self.steam_downloads = {}
+        self.fallback_download = None
+
+
 class SteamDatabase:
 
     """Database of steam information."""
 
-    def __init__(self, steam_path, steam_api_key: str, pictures: bool, cache_folder, prefer_uri=False):
+    def __init__(
+        self,
+        steam_path,
+        steam_api_key: str,
+        pictures: bool,
+        cache_folder,
+        prefer_uri=False,
+        art_download_workers=8,
+        fuzzy_match_threshold=0.7,
+    ):
         """
         :steam_path: Path to folder containing steam.exe.
         :cache_folder: Where to store downloaded files.
         :prefer_uri: Use uris for GameDefinitions where possible.
+        :art_download_workers: How many images to download at once.
+        :fuzzy_match_threshold: How similar (0-1) a name must be to guess its
+        appid when there's no exact match. 0 disables guessing.
         """
         self._steam_path = Path(steam_path)
         self._cache_folder = Path(cache_folder)
+        self._art_download_workers = max(1, art_download_workers)
+        self._fuzzy_match_threshold = fuzzy_match_threshold
+        self._session = _make_session(self._art_download_workers)
+        self._art_store = artstore.ArtStore(self._cache_folder / k_art_folder)
+        self._resolutions = _AppidResolutions(
+            self._cache_folder / k_resolutions_fname, fuzzy_match_threshold
+        )
+        self._failed_art_count = 0
 
         if pictures and steam_api_key is None:
             print("If you want to fetch art, you need to provide a --steam-api-key")
             sys.exit(1)
 
-        if pictures:
-            self._apps = self._load_app_list(steam_api_key)
+        # Loaded on first use since we often don't need it.
+        self._steam_api_key = steam_api_key
+        self._apps = None
         self._prefer_uri = prefer_uri
 
     def enumerate_steam_accounts(self):
@@ -92,6 +274,11 @@ class SteamDatabase:
 
         enumerate_steam_accounts() -> list(SteamAccount)
         """
+        login_names = _read_login_users(self._steam_path)
+        cache_fname = self._cache_folder / k_account_names_fname
+        cache = util.load_json_cache(cache_fname, k_account_names_version)
+        new_cache = {}
+
         accounts = list()
         with os.scandir(self._steam_path / "userdata") as childs:
             for child in childs:
@@ -100,173 +287,142 @@ class SteamDatabase:
 
                 steamid = os.fsdecode(child.name)
 
-                # we need to look inside this user's localconfig.vdf to figure out their
-                # display name
-
                 localconfig_file = os.path.join(child.path, "config/localconfig.vdf")
-                if not os.path.exists(localconfig_file):
+                try:
+                    st = os.stat(localconfig_file)
+                except FileNotFoundError:
                     continue
 
-                # here we just replace any malformed characters since we are only doing this to get the
-                # display name
-                with open(
-                    localconfig_file, "r", encoding="utf-8", errors="replace"
-                ) as localconfig:
-                    cfg = vdf.load(localconfig)["UserLocalConfigStore"]
-                    username = "(unknown username)"
-                    # Some users have Friends, some have friends, and some are friendless
-                    if "friends" in cfg:
-                        username = cfg["friends"]["PersonaName"]
-                    if "Friends" in cfg:
-                        username = cfg["Friends"]["PersonaName"]
-                    accounts.append(SteamAccount(steamid, username))
-
+                username = login_names.get(steamid)
+                if not username:
+                    # Steam doesn't list every account in loginusers, so
+                    # fall back to looking inside their localconfig.vdf.
+                    fingerprint = [st.st_size, st.st_mtime_ns]
+                    entry = cache.get(localconfig_file)
+                    if entry and entry["fingerprint"] == fingerprint:
+                        username = entry["username"]
+                    else:
+                        username = _read_persona_name(localconfig_file)
+                    new_cache[localconfig_file] = {
+                        "fingerprint": fingerprint,
+                        "username": username,
+                    }
+
+                accounts.append(SteamAccount(steamid, username or "(unknown username)"))
+
+        if new_cache != cache:
+            util.save_json_cache(cache_fname, k_account_names_version, new_cache)
         return accounts
 
-    def _make_gamename_comparable(self, name):
-        """Convert a game name into something easier to compare. Does minimal
-        transformations to ensure the best matches, but removes irrelevant
-        details.
+    def _load_app_list(self, steam_api_key: str):
+        """Load the app list and bring it up to date.
 
-        _make_gamename_comparable(str) -> str
+        _load_app_list() -> AppList
         """
-        # Always remove hypen because it adds extra uncertainty.
-        name = re_remove_hyphen.sub("", name)
-        # Ignore 'the' vs 'The' differences (fixes Into The Breach)
-        name = name.lower()
-        return name
+        self._cache_folder.mkdir(parents=True, exist_ok=True)
+        apps = applist.AppList(self._cache_folder / applist.k_applist_db_fname)
+        apps.migrate_from_json(self._cache_folder / k_applist_fname)
+        apps.sync(self._session, steam_api_key)
+        return apps
 
-    def _load_app_list(self, steam_api_key: str):
-        """Load or download the app list.
+    def _get_app_list(self):
+        """Get the app list, loading it if this is the first time.
 
-        _load_app_list() -> dict
+        _get_app_list() -> AppList
         """
-        data = None
-        now = datetime.utcnow()
-        current_version = 3
+        if self._apps is None:
+            self._apps = self._load_app_list(self._steam_api_key)
+        return self._apps
 
-        applist_file = self._cache_folder / k_applist_fname
-        if applist_file.is_file():
-            with applist_file.open("r", encoding="utf-8") as file:
-                data = json.load(file)
+    def get_art_store_folder(self):
+        """Get where we keep downloaded art for copying into grid folders.
 
-            if data["version"] != current_version:
-                data = None
-            else:
-                write_date = datetime.fromisoformat(data["download_timestamp"])
-                delta = now - write_date
-                if delta.days > 7:
-                    # Stale applist. Trigger re-download.
-                    data = None
-
-        if not data:
-            print("Downloading latest app list from Steam...")
-            response = requests.get(
-                f"https://api.steampowered.com/IStoreService/GetAppList/v1/?key={steam_api_key}&max_results=50000"
-            )
-            apps = response.json()["response"]["apps"]
-            name_to_id = {}
-            stripped_to_id = {}
-            for g in apps:
-                name = g["name"]
-                if not name:
-                    continue
-                name = self._make_gamename_comparable(name)
-                name_to_id[name] = g["appid"]
-                if " trial" not in name and " demo" not in name:
-                    # Include a stripped set for better name guessing.
-                    # Without accents (for ABZU):
-                    stripped = _remove_accents(name)
-                    if stripped not in name_to_id:
-                        stripped_to_id[stripped] = g["appid"]
-                    # Without punctuation (for Raji)
-                    stripped = _remove_punctuation(name)
-                    if stripped not in name_to_id:
-                        stripped_to_id[stripped] = g["appid"]
-                    # Without subtitle:
-                    stripped = re_remove_subtitle.sub("", name, 1)
-                    if stripped not in name_to_id:
-                        stripped_to_id[stripped] = g["appid"]
-            data = {
-                "version": current_version,
-                "download_timestamp": now.isoformat(),
-                "name_to_id": name_to_id,
-                "stripped_to_id": stripped_to_id,
-            }
-            applist_file.parent.mkdir(parents=True, exist_ok=True)
-            with applist_file.open("w", encoding="utf-8") as file:
-                file.write(json.dumps(data, indent=2))
-
-        return data
+        get_art_store_folder() -> Path
+        """
+        return self._art_store.folder
+
+    def get_failed_art_count(self):
+        """How many games had art fail to download in a way that might work
+        next time (like when the network or disk had problems)?
+
+        get_failed_art_count() -> int
+        """
+        return self._failed_art_count
+
+    def has_loaded_app_list(self):
+        """Did we need the app list to find any appids?
+
+        has_loaded_app_list() -> bool
+        """
+        return self._apps is not None
 
     def guess_appid(self, name):
         """Guess the steam appid for a given game name.
 
+        Looks up the name's canonical key first and falls back to the most
+        similar name in the app list.
+
         guess_appid(str) -> str
         """
-        name_to_id = self._apps["name_to_id"]
-        stripped_to_id = self._apps["stripped_to_id"]
-        name = self._make_gamename_comparable(name)
-        appid = name_to_id.get(name)
+        apps = self._get_app_list()
+        appid = apps.lookup(name)
 
         if appid == 3970:
             # Assume Prey 2017 over Prey 2006 since the newer one has more art.
             appid = 480490
 
         if not appid:
-            # For: "Control" -> "Control Ultimate Edition"
-            for suffix in [" ultimate edition", " digital edition", " steam edition"]:
-                long_name = name + suffix
-                appid = name_to_id.get(long_name)
-                if appid:
-                    break
-        if not appid:
-            # For: "Death's Door Win10" -> "Death's Door"
-            stripped = re.sub(r" win10\b", "", name, 1)
-            appid = name_to_id.get(stripped)
-        if not appid:
-            # For: "Yakuza Kiwami (PC)" -> "Yakuza Kiwami"
-            stripped = re_remove_braces.sub("", name, 1)
-            appid = name_to_id.get(stripped)
-        if not appid:
-            # For: "Ghost of a Tale PC" -> "Ghost of a Tale"
-            # For: "Genesis Noir for Windows" -> "Genesis Noir"
-            stripped = re_remove_pc.sub("", name, 1)
-            appid = name_to_id.get(stripped)
-        if not appid:
-            # For: "Grand Theft Auto V: Premium Edition" -> "Grand Theft Auto V"
-            stripped = re_remove_subtitle.sub("", name, 1)
-            appid = stripped_to_id.get(stripped)
-        if not appid:
-            # For: "Raji: An Ancient Epic" -> "Raji An Ancient Epic"
-            stripped = _remove_punctuation(name)
-            appid = name_to_id.get(stripped)
-            if not appid:
-                appid = stripped_to_id.get(stripped)
-        if not appid:
-            # For: "ABZÛ" -> "ABZU"
-            name = _remove_accents(name)
-            appid = name_to_id.get(name)
-            if not appid:
-                appid = stripped_to_id.get(name)
-        if not appid:
-            # For: "Rocket League®" -> "Rocket League"
-            name = _strip_nonascii(name)
-            appid = name_to_id.get(name)
+            # For: "Witcher 3 Wild Hunt GOTY" -> "The Witcher 3: Wild Hunt"
+            appid, score = apps.find_similar(name, self._fuzzy_match_threshold)
+            if appid:
+                print(f"Guessed appid {appid} for '{name}' ({score:.0%} similar)")
         # Might return None.
         return appid
 
+    def resolve_appids(self, names, storetag=None):
+        """Get the steam appids for many game names.
+
+        Names we've resolved before are answered from the cache (including
+        names that had no appid), so only new names search the app list.
+
+        resolve_appids(list[str], str) -> dict[str,int]
+        """
+        appids = {}
+        for name in names:
+            if name in appids:
+                continue
+            is_cached, appid = self._resolutions.get(name, storetag)
+            if not is_cached:
+                appid = self.guess_appid(name)
+                self._resolutions.set(name, storetag, appid)
+            appids[name] = appid
+        self._resolutions.save()
+        return appids
+
+    def _resolve_game_appids(self, games):
+        """Get the steam appid for each GameDefinition.
+
+        _resolve_game_appids(list[GameDefinition]) -> list[int]
+        """
+        names_by_store = {}
+        for game in games:
+            names_by_store.setdefault(game.storetag, []).append(game.display_name)
+        appids_by_store = {
+            storetag: self.resolve_appids(names, storetag)
+            for storetag, names in names_by_store.items()
+        }
+        return [appids_by_store[game.storetag][game.display_name] for game in games]
+
     def download_art_multiple(self, user, games, should_replace_existing):
         """Download art for a list of GameDefinitions
 
-        download_art_multiple(SteamAccount, list[GameDefinition], bool) -> None
+        Every image for every game is fetched concurrently, but results are
+        still reported per game in the order they were given.
+
+        download_art_multiple(SteamAccount, list[GameDefinition], bool) -> int
         """
-        count = 0
-        for game in games:
-            success = self.download_art(user, game, should_replace_existing)
-            if success:
-                count += 1
-        return count
+        jobs = self._download_art_concurrently(user, games, should_replace_existing)
+        return sum(1 for job in jobs if job.downloaded_art)
 
     def _try_copy_art_to(self, art_fname, dest):
         """Duplicate downloaded art.
@@ -292,55 +448,119 @@ class SteamDatabase:
         return not fname.endswith(".gif")
 
     def download_art(self, user, game, should_replace_existing):
-        targets = self._get_grid_art_destinations(game, user)
-        targets["boxart"].parent.mkdir(exist_ok=True, parents=True)
-        appid = self.guess_appid(game.display_name)
-        downloaded_art = False
-        found_art = 0
-        expected_art = len(targets)
-        logs = []
-        if appid:
-            urls = self._get_art_urls(appid)
-
-            for k, url in urls.items():
-                did_download, fname, msg = self._try_download_image(
-                    url, targets[k], should_replace_existing
-                )
-                downloaded_art |= did_download
-                if fname:
-                    found_art += 1
-                else:
-                    logs.append(msg)
-        else:
-            logs.append("Appid not found.")
-
-        if (
-            found_art < expected_art
-            and game.art_url
-            and self._is_supported_image(game.art_url)
-        ):
-            # Maybe not on steam. Fall back to other art.
-            dest_fname = targets["logo"]
-            did_download, fname, msg = self._try_download_image(
-                game.art_url, dest_fname, should_replace_existing
-            )
-            downloaded_art |= did_download
-            if fname:
-                found_art += 3
-                # Use the logo art for box art. Looks better than grey box.
-                self._try_copy_art_to(fname, targets["boxart"])
-                # Logo is closest to big picture's banner format.
-                self._try_copy_art_to(fname, targets["10foot"])
-                logs.append("Using fallback art. No hero available.")
-            else:
-                logs.append(msg)
-        else:
-            logs.append("No non-steam art found.")
+        """Download art for a single GameDefinition
+
+        download_art(SteamAccount, GameDefinition, bool) -> bool
+        """
+        (job,) = self._download_art_concurrently(user, [game], should_replace_existing)
+        return job.downloaded_art
 
-        if found_art < expected_art:
-            print(f"Found {found_art}/{expected_art} art for '{game.display_name}'")
-            print(" ", "\n  ".join(logs))
-        return downloaded_art
+    def _download_art_concurrently(self, user, games, should_replace_existing):
+        """Download art for games on a pool of worker threads.
+
+        Steam art for every game is queued up front. Fallback art depends on
+        how many Steam images were found, so it's queued in a second pass once
+        each game's Steam downloads finish.
+
+        _download_art_concurrently(SteamAccount, list[GameDefinition], bool) -> list[_ArtJob]
+        """
+        grid = Path(user.get_grid_folder(self._steam_path))
+        grid.mkdir(exist_ok=True, parents=True)
+        try:
+            (grid / k_art_validators_fname).unlink()
+        except FileNotFoundError:
+            pass
+
+        jobs = []
+        for game in games:
+            targets = self._get_grid_art_destinations(game, user)
+            jobs.append(_ArtJob(game, targets))
+
+        # Games that already have all their art don't need an appid, so we
+        # can often skip searching (and loading) the app list.
+        if not should_replace_existing:
+            for job in jobs:
+                if self._has_all_art(job.targets):
+                    job.found_art = job.expected_art
+        pending = [job for job in jobs if job.found_art < job.expected_art]
+        appids = self._resolve_game_appids([job.game for job in pending])
+
+        with ThreadPoolExecutor(max_workers=self._art_download_workers) as pool:
+            for job, appid in zip(pending, appids):
+                targets = job.targets
+                if appid:
+                    urls = self._get_art_urls(appid)
+                    for k, url in urls.items():
+                        job.steam_downloads[k] = pool.submit(
+                            self._try_download_image,
+                            url,
+                            targets[k],
+                            should_replace_existing,
+                            f"{appid}:{k}",
+                        )
+                else:
+                    job.logs.append("Appid not found.")
+
+            for job in pending:
+                for future in job.steam_downloads.values():
+                    did_download, fname, msg, failed = future.result()
+                    job.downloaded_art |= did_download
+                    job.failed_art += failed
+                    if fname:
+                        job.found_art += 1
+                    else:
+                        job.logs.append(msg)
+
+                art_url = job.game.art_url
+                if (
+                    job.found_art < job.expected_art
+                    and art_url
+                    and self._is_supported_image(art_url)
+                ):
+                    # Maybe not on steam. Fall back to other art.
+                    job.fallback_download = pool.submit(
+                        self._try_download_image,
+                        art_url,
+                        job.targets["logo"],
+                        should_replace_existing,
+                    )
+                else:
+                    job.logs.append("No non-steam art found.")
+
+            for job in pending:
+                if job.fallback_download:
+                    did_download, fname, msg, failed = job.fallback_download.result()
+                    job.downloaded_art |= did_download
+                    job.failed_art += failed
+                    if fname:
+                        job.found_art += 3
+                        # Use the logo art for box art. Looks better than grey box.
+                        self._try_copy_art_to(fname, job.targets["boxart"])
+                        # Logo is closest to big picture's banner format.
+                        self._try_copy_art_to(fname, job.targets["10foot"])
+                        job.logs.append("Using fallback art. No hero available.")
+                    else:
+                        job.logs.append(msg)
+
+                if job.found_art < job.expected_art:
+                    print(
+                        f"Found {job.found_art}/{job.expected_art} art for '{job.game.display_name}'"
+                    )
+                    print(" ", "\n  ".join(job.logs))
+
+        self._art_store.save()
+        self._failed_art_count += sum(1 for job in jobs if job.failed_art)
+        return jobs
+
+    def _has_all_art(self, targets):
+        """Does every grid image already exist in any supported format?
+
+        _has_all_art(dict[str,Path]) -> bool
+        """
+        return all(
+            any(dest.with_suffix(ext).is_file() for ext in [".jpg", ".png"])
+            for dest in targets.values()
+        )
 
     def _get_art_urls(self, appid):
         """Get the hero, boxart, and logo art urls for the input appid.
@@ -354,29 +574,96 @@ class SteamDatabase:
             "10foot": f"https://steamcdn-a.akamaihd.net/steam/apps/{appid}/header.jpg",
         }
 
-    def _try_download_image(self, url, dest_fname, should_replace_existing):
-        url_path = Path(url)
-        fname = dest_fname.with_suffix(url_path.suffix)
-        if not fname.is_file() or should_replace_existing:
-            return self._download_image(url, fname)
-        return False, fname, "Already exists"
+    def _try_download_image(self, url, dest_fname, should_replace_existing, key=None):
+        """Put the image at url in the grid as dest_fname (with the url's
+        extension).
 
-    def _download_image(self, url, dest_fname):
-        """Download an image to dest_fname.
+        Images we downloaded before are copied from the art store without
+        asking the server, unless we're replacing art. key names the image
+        in the store (like "440:hero") and defaults to the url.
 
         Returns:
-        * did we download something
-        * the image file on disk (if downloaded or already existed)
+        * did we add or change art
+        * the image file on disk (if it exists now)
         * status message
+        * did it fail in a way that might work next time
 
-        _download_image(str, Path) -> (bool,str,str)
+        _try_download_image(str, Path, bool, str) -> (bool,Path,str,bool)
         """
-        page = requests.get(url)
-        if page.status_code == 200:
-            with dest_fname.open("wb") as f:
-                f.write(page.content)
-            return True, dest_fname, f"Downloaded '{url}' to '{dest_fname}'."
-        return False, None, f"Error {page.status_code} for '{url}'."
+        fname = dest_fname.with_suffix(Path(url).suffix)
+        exists = fname.is_file()
+        if exists and not should_replace_existing:
+            return False, fname, "Already exists", False
+
+        key = key or url
+        try:
+            stored = self._art_store.get(key, url)
+            if stored and not should_replace_existing:
+                self._art_store.copy_to(stored, fname)
+                return True, fname, f"Copied stored '{url}' to '{fname}'.", False
+
+            # Only download again if the server says it changed.
+            entry, changed, msg, status = self._download_image(url, key, stored)
+            if not entry:
+                # Steam doesn't have every kind of art for every app, and
+                # asking again won't change that.
+                return False, None, msg, status != 404
+            if not changed and exists:
+                return False, fname, msg, False
+            self._art_store.copy_to(entry, fname)
+        except (requests.RequestException, OSError) as e:
+            # One bad image (or a full disk while storing or copying it)
+            # shouldn't stop us from syncing the rest.
+            return (
+                False,
+                fname if exists else None,
+                f"Failed to get '{url}': {e}",
+                True,
+            )
+        return True, fname, msg, False
+
+    def _download_image(self, url, key, stored=None):
+        """Download an image into the art store.
+
+        If we stored this image before, the request is conditional and an
+        unchanged image isn't downloaded again.
+
+        Returns:
+        * the store entry for the image (None if the download failed)
+        * did the image change
+        * status message
+        * http status code
+
+        _download_image(str, str, dict) -> (dict,bool,str,int)
+        """
+        headers = {}
+        if stored:
+            if stored["etag"]:
+                headers["If-None-Match"] = stored["etag"]
+            if stored["last_modified"]:
+                headers["If-Modified-Since"] = stored["last_modified"]
+
+        with self._session.get(
+            url, headers=headers, stream=True, timeout=k_http_timeout
+        ) as page:
+            if page.status_code == 304:
+                return stored, False, f"Unchanged '{url}'.", page.status_code
+            if page.status_code != 200:
+                return (
+                    None,
+                    False,
+                    f"Error {page.status_code} for '{url}'.",
+                    page.status_code,
+                )
+
+            entry = self._art_store.add(
+                key,
+                url,
+                page.iter_content(chunk_size=64 * 1024),
+                Path(url).suffix,
+                page.headers,
+            )
+        return entry, True, f"Downloaded '{url}'.", page.status_code
 
     def _get_grid_art_destinations(self, game, user):
         """Get filepaths for the grid images for the input shortcut.
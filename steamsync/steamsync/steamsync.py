@@ -1,22 +1,33 @@
 # LICENSE: AGPLv3. See LICENSE at root of repo
 
 import argparse
+import copy
+import hashlib
+import multiprocessing
 import os
 import platform
 import pprint
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import appdirs
-import vdf
 
+import steamsync.backups as backups
 import steamsync.defs as defs
+import steamsync.fingerprint as fingerprint
+import steamsync.fsprobe as fsprobe
+import steamsync.runner as runner
+import steamsync.shortcuts as shortcuts_vdf
 import steamsync.steameditor as steameditor
+import steamsync.util as util
+import steamsync.watch as watch
 from steamsync.launchers.egs import EpicGamesStoreLauncher
 from steamsync.launchers.itch import ItchLauncher
 from steamsync.launchers.launcher import Launcher
 from steamsync.launchers.legendary import LegendaryLauncher
-from steamsync.launchers.xbox import XboxLauncher
+from steamsync.launchers.xbox import FileInventory, XboxLauncher
 
 
 def get_default_steam_path():
@@ -54,6 +65,36 @@ def parse_arguments():
         required=False,
     )
 
+    parser.add_argument(
+        "--legendary-config",
+        default=None,
+        help="Path to legendary's config folder, where it keeps installed.json. Defaults to where legendary looks ($LEGENDARY_CONFIG_PATH or ~/.config/legendary). If we can't read it, we run 'legendary' instead.",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--xbox-inventory",
+        default=None,
+        help="For testing. Read the installed Xbox packages from this json file (in the format list_xbox_games.ps1 prints) instead of asking PowerShell.",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--launcher-timeout",
+        default=120,
+        type=float,
+        help="Seconds to wait for a storefront to list its games before giving up on it",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--command-timeout",
+        default=runner.k_default_timeout,
+        type=float,
+        help="Seconds to wait for a program we run to list games (legendary, PowerShell) before giving up on it",
+        required=False,
+    )
+
     parser.add_argument(
         "--itch-library",
         default=os.path.join(appdirs.user_config_dir("itch", roaming=True), "apps"),
@@ -76,6 +117,14 @@ def parse_arguments():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--force",
+        default=False,
+        help="With --all, sync even if no stores, options, shortcuts, or art changed since the last sync",
+        required=False,
+        action="store_true",
+    )
+
     parser.add_argument(
         "--steam-api-key",
         default=None,
@@ -102,7 +151,7 @@ def parse_arguments():
     parser.add_argument(
         "--live-dangerously",
         default=False,
-        help="Don't backup Steam's shortcuts.vdf file to shortcuts.vdf-{time}.bak",
+        help="Don't backup Steam's shortcuts.vdf file before changing it",
         required=False,
         action="store_true",
     )
@@ -114,6 +163,14 @@ def parse_arguments():
         required=False,
     )
 
+    parser.add_argument(
+        "--all-accounts",
+        default=False,
+        action="store_true",
+        help="Install the shortcuts to every Steam account on this machine. Games are collected once and art is downloaded once for everyone.",
+        required=False,
+    )
+
     parser.add_argument(
         "--use-uri",
         default=False,
@@ -138,6 +195,22 @@ def parse_arguments():
         required=False,
     )
 
+    parser.add_argument(
+        "--art-download-workers",
+        default=8,
+        type=int,
+        help="How many art images to download at the same time",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--fuzzy-match-threshold",
+        default=0.7,
+        type=float,
+        help="When downloading art for a game whose name doesn't exactly match a Steam app, use the most similar Steam app if its name is at least this similar (0 to 1). 0 disables the guess.",
+        required=False,
+    )
+
     parser.add_argument(
         "--init-shortcuts-file",
         default=False,
@@ -154,6 +227,30 @@ def parse_arguments():
         required=False,
     )
 
+    parser.add_argument(
+        "--watch",
+        default=False,
+        action="store_true",
+        help="Keep running and update shortcuts when games are installed or uninstalled. Only rescans the store that changed. Needs --all.",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--list-backups",
+        default=False,
+        action="store_true",
+        help="List the backups of Steam's shortcuts.vdf file and exit.",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--restore-backup",
+        default=None,
+        metavar="BACKUP",
+        help="Replace Steam's shortcuts.vdf file with a backup and exit. BACKUP is a number from --list-backups (1 is the newest) or the start of a backup's hash.",
+        required=False,
+    )
+
     args = parser.parse_args()
     if not args.source:
         args.source = defs.TAGS
@@ -277,18 +374,15 @@ def to_shortcut(game, use_uri):
 
 
 def get_exe_from_shortcut(shortcut):
-    exe = shortcut.get("Exe")
-    if not exe:
-        exe = shortcut.get("exe")
     # May return None
-    return exe
+    return shortcuts_vdf.get_exe(shortcut)
 
 
 def add_games_to_shortcut_file(
     steamdb,
     user,
     games,
-    shortcuts,
+    shortcut_index,
     use_uri,
     replace_existing,
     download_art_unsupported,
@@ -299,7 +393,7 @@ def add_games_to_shortcut_file(
         steamdb (SteamDatabase): steam wrapper object
         user (SteamAccount): user to add shortcuts to
         games ([GameDefinition]): games to add
-        shortcuts (dict): loaded shortcuts vdf file content to modify
+        shortcut_index (ShortcutIndex): loaded shortcuts vdf file content to modify
         use_uri (bool): if we should use the EGS uri, or the path to the executable
         replace_existing (bool): if a shortcut already exists, clobber it with new data for that game
         download_art_unsupported (bool): download art for unsupported games
@@ -321,13 +415,12 @@ def add_games_to_shortcut_file(
         print("You may experience issues with online games (eg GTAV!)")
         print()
 
-    # Make a lookup of the path of every shortcut installed to their index in
+    # The index maps the path of every shortcut installed to their index in
     # the shortcuts file. If a path is already in the shortcuts file, we won't
     # add another one (ie the path is what makes a shortcut unique) or if we
     # want to force updating, we can clobber the existing entry.
-    path_to_index = {}
 
-    art_downloads = 0
+    unsupported_games = []
     if download_art_unsupported:
         print("Downloading art for existing shortcuts...")
 
@@ -336,7 +429,7 @@ def add_games_to_shortcut_file(
         exe, _ = game.get_launcher(use_uri)
         supported_games[exe] = game
 
-    for k, v in shortcuts["shortcuts"].items():
+    for k, v in shortcut_index.get_shortcuts().items():
         exe = get_exe_from_shortcut(v)
         if not exe:
             print(
@@ -344,52 +437,39 @@ def add_games_to_shortcut_file(
             )
             print(v)
             continue
-        launch_args = v.get("LaunchOptions", "")
-        # Include args to handle mulitple explorer.exe options for xbox.
-        path = f"{exe}|{launch_args}"
-        path_to_index[path] = k
         if download_art_unsupported and exe not in supported_games:
             appname = v.get("appname")
             # Create a temp definition to specify info required to download.
-            game = defs.GameDefinition(
-                exe,
-                appname,
-                appname,  # No alternative name.
-                str(Path(exe).parent),
-                "",
-                None,
-                "ignore tag",
-                shortcut_id=v.get("appid"),  # may not exist yet
+            unsupported_games.append(
+                defs.GameDefinition(
+                    exe,
+                    appname,
+                    appname,  # No alternative name.
+                    str(Path(exe).parent),
+                    "",
+                    None,
+                    "ignore tag",
+                    shortcut_id=v.get("appid"),  # may not exist yet
+                )
             )
-            success = steamdb.download_art(user, game, should_replace_existing=False)
-            if success:
-                art_downloads += 1
 
     if download_art_unsupported:
+        art_downloads = steamdb.download_art_multiple(
+            user, unsupported_games, should_replace_existing=False
+        )
         print(f"Downloaded new art for {art_downloads} games.")
         print()
 
-    # the shortcuts "list" is actually a dict of "index": value
-    # find the last one so we can add on to the end
     added = 0
-
-    all_indexes = shortcuts["shortcuts"].keys()
-    if len(all_indexes) == 0:
-        last_index = 0
-    else:
-        last_index = max(int(idx) for idx in all_indexes)
-
     game_results = []
     for game in games:
         shortcut, launch_args = game.get_launcher(use_uri)
-        path = f"{shortcut}|{launch_args}"
-        i = path_to_index.get(path, None)
+        i = shortcut_index.find(shortcut, launch_args)
         if not i:
             # Detect old xbox exe shortcuts so we can migrate them.
-            path = f"{game.executable_path}|"
-            i = path_to_index.get(path, None)
+            i = shortcut_index.find(game.executable_path, "")
         if i:
-            old_shortcut = shortcuts["shortcuts"][i]
+            old_shortcut = shortcut_index.get_shortcuts()[i]
             # Preserve the appid stored in shortcuts so existing art still
             # matches. (Steam generates these ids if we don't assign them.)
             game.shortcut_id = old_shortcut.get("appid")
@@ -398,7 +478,7 @@ def add_games_to_shortcut_file(
                 print(
                     f"Replacing {old_shortcut['appname']} ({get_exe_from_shortcut(old_shortcut)} {old_shortcut.get('LaunchOptions', '')})\n     with {new_shortcut['appname']} ({get_exe_from_shortcut(new_shortcut)} {new_shortcut.get('LaunchOptions', '')})"
                 )
-                shortcuts["shortcuts"][i] = new_shortcut
+                shortcut_index.replace(i, new_shortcut)
                 added += 1
 
             else:
@@ -406,8 +486,7 @@ def add_games_to_shortcut_file(
                 print(msg)
                 game_results.append(msg)
             continue
-        last_index += 1
-        shortcuts["shortcuts"][str(last_index)] = to_shortcut(game, use_uri)
+        shortcut_index.add(to_shortcut(game, use_uri))
         added += 1
 
     print(f"Added {added} new games")
@@ -423,7 +502,7 @@ def remove_missing_games_from_shortcut_file(
     steamdb,
     user,
     games,
-    shortcuts,
+    shortcut_index,
 ):
     """Remove games without executables from the shortcut file
 
@@ -431,7 +510,7 @@ def remove_missing_games_from_shortcut_file(
         steamdb (SteamDatabase): steam wrapper object
         user (SteamAccount): user to add shortcuts to
         games ([GameDefinition]): all known games (for uri/xbox checking)
-        shortcuts (dict): loaded shortcuts vdf file content to modify
+        shortcut_index (ShortcutIndex): loaded shortcuts vdf file content to modify
 
     Returns:
         (([string], integer), string): First element of tuple is a tuple of an
@@ -443,9 +522,21 @@ def remove_missing_games_from_shortcut_file(
 
     game_results = []
 
+    # Games without executables are identified by their uri.
+    game_uris = {g.uri for g in games if g.uri}
+
+    # List every folder with an exe up front, so each shortcut's check
+    # doesn't wait on its own round trip to a network drive.
+    probe = fsprobe.get_probe()
+    probe.prefetch(
+        exe.strip('"')
+        for exe in map(get_exe_from_shortcut, shortcut_index.get_shortcuts().values())
+        if exe and not shortcuts_vdf.is_uri_shortcut(exe)
+    )
+
     found_shortcuts = []
     missing_shortcuts = []
-    for k, v in shortcuts["shortcuts"].items():
+    for k, v in shortcut_index.get_shortcuts().items():
         exe = get_exe_from_shortcut(v)
         if not exe:
             print(
@@ -458,18 +549,13 @@ def remove_missing_games_from_shortcut_file(
 
         exists = False
 
-        is_uri = "://" in exe or exe.lower().endswith("explorer.exe")
-        if is_uri:
-            args = v.get("LaunchOptions", "")
-            exists |= any(g for g in games if g.uri == exe)  # epic uri
-            exists |= any(g for g in games if g.uri == args)  # xbox uri
+        if shortcuts_vdf.is_uri_shortcut(exe):
+            exists = any(uri in game_uris for uri in shortcuts_vdf.get_uris(v))
         else:
-            exe_path = Path(exe)
-            if not exe_path.is_file():
+            exists = probe.is_file(exe)
+            if not exists:
                 # Manually added shortcuts may have additional quotes.
-                exe_path = Path(exe.strip('"'))
-
-            exists = exe_path.is_file()
+                exists = probe.is_file(exe.strip('"'))
 
         if exists:
             found_shortcuts.append(v)
@@ -480,9 +566,7 @@ def remove_missing_games_from_shortcut_file(
             print(msg)
             game_results.append(msg)
 
-    shortcuts["shortcuts"] = {}
-    for i, v in enumerate(found_shortcuts):
-        shortcuts["shortcuts"][str(i)] = v
+    shortcut_index.keep_only(found_shortcuts)
 
     print(f"Removed {len(missing_shortcuts)} missing games")
     if not missing_shortcuts:
@@ -493,35 +577,122 @@ def remove_missing_games_from_shortcut_file(
     return (game_results, len(missing_shortcuts)), None
 
 
-def collect_all_games(args):
-    """Collect games from every enabled store"""
+def _collect_from_launcher(launcher, results):
+    """Run a single launcher's collect_games and store the outcome in results.
+
+    Runs on a worker thread. Stores (games, error, seconds) under the
+    launcher's store id.
+    """
+    start = time.perf_counter()
+    try:
+        games = launcher.collect_games()
+        error = None
+    except Exception as e:
+        games = []
+        error = e
+    results[launcher.get_store_id()] = (games, error, time.perf_counter() - start)
+
+
+def create_launchers(args, commands):
+    """Create a launcher for every store the user asked for
+
+    create_launchers(Namespace, CommandRunner) -> dict[str, Launcher]
+    """
+    cache_folder = appdirs.user_cache_dir("steamsync")
+    xbox_inventory = None
+    if args.xbox_inventory:
+        xbox_inventory = FileInventory(args.xbox_inventory)
     launchers: dict[str, Launcher] = {
-        defs.TAG_XBOX: XboxLauncher(),
-        defs.TAG_LEGENDARY: LegendaryLauncher(legendary_command=args.legendary_command),
-        defs.TAG_EPIC: EpicGamesStoreLauncher(egs_manifest_path=args.egs_manifests),
-        defs.TAG_ITCH: ItchLauncher(library_path=args.itch_library),
+        defs.TAG_XBOX: XboxLauncher(
+            cache_folder=cache_folder, inventory=xbox_inventory, runner=commands
+        ),
+        defs.TAG_LEGENDARY: LegendaryLauncher(
+            legendary_command=args.legendary_command,
+            config_path=args.legendary_config,
+            runner=commands,
+        ),
+        defs.TAG_EPIC: EpicGamesStoreLauncher(
+            egs_manifest_path=args.egs_manifests, cache_folder=cache_folder
+        ),
+        defs.TAG_ITCH: ItchLauncher(
+            library_path=args.itch_library, cache_folder=cache_folder
+        ),
     }
 
     # remove launchers they didn't ask for
     for l in list(launchers):
         if l not in args.source:
             del launchers[l]
+    return launchers
 
-    games: list[defs.GameDefinition] = []
 
-    for l in launchers.values():
+def collect_all_games(args, launchers, commands):
+    """Collect games from every enabled store
+
+    Each launcher runs on its own worker thread so a slow store doesn't hold
+    up the others. A launcher that doesn't finish within
+    args.launcher_timeout seconds is abandoned and contributes no games.
+    Results are merged in the same order as the launchers regardless of
+    which one finishes first.
+
+    Returns the games and the store ids of the launchers that finished
+    without errors.
+
+    collect_all_games(Namespace, dict, CommandRunner) -> list[GameDefinition], set[str]
+    """
+    first_timing = len(commands.timings)
+    workers = {}
+    results = {}
+    for tag, l in launchers.items():
         if not l.is_installed():
             print(f"{l.get_display_name()} appears to not be installed")
             continue
         print(f"Collecting games from {l.get_display_name()}")
 
-        try:
-            games.extend(l.collect_games())
-        except Exception as e:
+        # Daemon threads so a hung store can't keep us from exiting.
+        worker = threading.Thread(
+            target=_collect_from_launcher,
+            args=(l, results),
+            name=f"collect-{tag}",
+            daemon=True,
+        )
+        worker.start()
+        workers[tag] = worker
+
+    # Every launcher started at the same time, so they share a deadline.
+    deadline = time.monotonic() + args.launcher_timeout
+
+    games: list[defs.GameDefinition] = []
+    collected = set()
+    timings = []
+    for tag, worker in workers.items():
+        l = launchers[tag]
+        worker.join(max(0, deadline - time.monotonic()))
+        if worker.is_alive():
+            print(
+                f"Timed out collecting games from {l.get_display_name()} after {args.launcher_timeout:g}s, skipping it"
+            )
+            timings.append((l.get_display_name(), "timed out"))
+            continue
+
+        found, error, seconds = results[tag]
+        timings.append((l.get_display_name(), f"{seconds:.2f}s"))
+        if error:
             print(f"Unexpected failure collecting games from {l.get_display_name()}")
-            print(e)
+            print(error)
+            continue
+        games.extend(found)
+        collected.add(tag)
+
+    print("\nTime spent collecting games:")
+    for name, took in timings:
+        print(f"  {name}: {took}")
+    if commands.timings[first_timing:]:
+        print("Time spent running commands:")
+        for timing in commands.timings[first_timing:]:
+            print(f"  {timing}")
 
-    return games
+    return games, collected
 
 
 def get_steam_user(
@@ -580,6 +751,26 @@ def get_steam_user(
     return user
 
 
+def get_steam_users(steamdb: steameditor.SteamDatabase, args):
+    """Get the accounts to install shortcuts to: every account with
+    --all-accounts, otherwise the one the user picks.
+
+    get_steam_users(SteamDatabase, Namespace) -> list[SteamAccount]
+    """
+    if not args.all_accounts:
+        return [get_steam_user(steamdb, args.steam_path, args.steamid)]
+    try:
+        users = steamdb.enumerate_steam_accounts()
+    except FileNotFoundError as e:
+        print(
+            f"Steam path not found: '{args.steam_path}'. Use --steam-path for non-standard installs.",
+        )
+        raise e
+    users.sort(key=lambda user: user.username.lower())
+    print(f"Installing shortcuts to {len(users)} Steam accounts")
+    return users
+
+
 ####################################################################################################
 # Main
 
@@ -593,67 +784,239 @@ def _load_shortcuts(shortcut_file_path, can_init_on_missing):
         message = f"Could not find shortcuts file at `{shortcut_file_path}`\nEither make a shortcut in Steam (Library ➡ ➕ Add Game ➡ Add a Non-Steam Game...) first.\nOr enable option to initialize shortcuts  file. (--init-shortcuts-file)\nAborting."
         print(message)
         return
-    elif can_init_on_missing:
+    elif not os.path.exists(shortcut_file_path):
         shortcuts = {"shortcuts": {}}
     else:
         # read in the shortcuts file
         with open(shortcut_file_path, "rb") as sf:
-            shortcuts = vdf.binary_load(sf)
+            shortcuts = shortcuts_vdf.load(sf)
 
     return shortcuts
 
 
-def main():
-    args = parse_arguments()
+def _get_backup_store(user, shortcut_file_path):
+    """Get the user's shortcuts.vdf backups, moving in any .bak files that
+    older versions left next to shortcuts.vdf.
 
+    _get_backup_store(SteamAccount, str) -> backups.BackupStore
+    """
+    store = backups.BackupStore(backups.get_default_folder(user.steamid))
+    count = store.migrate_bak_files(shortcut_file_path)
+    if count:
+        print(f"Moved {count} `shortcuts.vdf` backups to `{store.folder}`")
+    return store
 
-    steamdb = steameditor.SteamDatabase(
-        args.steam_path,
-        args.steam_api_key,
-        args.download_art or args.download_art_all_shortcuts,
-        appdirs.user_cache_dir("steamsync"),
-        args.use_uri,
-    )
 
-    if args.dump_shortcut_vdf:
-        # Do this early to avoid showing game list.
-        user = get_steam_user(steamdb, args.steam_path, args.steamid)
-        shortcut_file_path = user.get_shortcut_filepath(steamdb._steam_path)
-        shortcuts = _load_shortcuts(shortcut_file_path, args.init_shortcuts_file)
-        print("Contents of", shortcut_file_path)
-        pprint.pprint(shortcuts)
-        return 0
+def print_backups(store, shortcut_file_path):
+    backup_list = store.list_backups()
+    if not backup_list:
+        print(f"No backups in `{store.folder}`")
+    else:
+        print(f"Backups in `{store.folder}`:")
+    for i, backup in enumerate(backup_list, 1):
+        when = backup.get_time().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{i:4}: {when}  {backup.size:>9} bytes  {backup.sha256[:12]}")
 
-    # 1. Collect all games from every enabled store
-    all_games = collect_all_games(args)
+    bak_files = backups.find_bak_files(shortcut_file_path)
+    if bak_files:
+        print(
+            f"{len(bak_files)} older backups next to `shortcuts.vdf` will be moved here the next time steamsync saves your shortcuts."
+        )
 
-    # 2. Print out the list of games we got
-    print_games(all_games, args.use_uri)
 
-    # 3. Have the user select the games they want
-    games = all_games
+def write_shortcuts(shortcut_file_path, shortcuts, backup_store):
+    """Save shortcuts to the user's shortcuts.vdf file.
 
-    if not args.all:
-        picks = None
-        while not picks:
-            picks = filter_games(games)
-            if picks is False:
-                print("Quitting...")
-                return 0
+    Writes to a temp file and swaps it in, so a crash can't leave Steam
+    with a partial file. Does nothing if the file already has the same
+    contents. The old contents are added to backup_store, unless it's None.
 
-        games = picks
+    Returns whether we wrote the file.
 
-    # 4. Pick the account to add shortcuts to (if needed)
-    user = get_steam_user(steamdb, args.steam_path, args.steamid)
+    write_shortcuts(str, dict, backups.BackupStore) -> bool
+    """
+    new_bytes = shortcuts_vdf.dumps(shortcuts)
+    old_hash = util.hash_file(shortcut_file_path)
+    if old_hash == hashlib.sha256(new_bytes).hexdigest():
+        print("No need to write `shortcuts.vdf` - it already has these shortcuts")
+        return False
 
-    # 5. Write shortcuts to steam!
+    if not backup_store:
+        print("Not backing up `shortcuts.vdf` since you enjoy danger")
+    elif old_hash:
+        print(f"Backing up `shortcuts.vdf` to `{backup_store.folder}`")
+        with open(shortcut_file_path, "rb") as f:
+            backup_store.add(f.read())
+
+    util.atomic_write_bytes(shortcut_file_path, new_bytes)
+    return True
+
+
+def _get_game_keys(games, use_uri):
+    """Map games by the launcher command that makes their shortcut unique.
+
+    _get_game_keys(list[GameDefinition], bool) -> dict
+    """
+    return {game.get_launcher(use_uri): game for game in games}
 
-    print(f"Installing shortcuts for SteamID {user.username} `{user.steamid}`")
 
+def apply_library_changes(args, steamdb, user, added, removed, backup_store):
+    """Add shortcuts for installed games and remove shortcuts for
+    uninstalled games, leaving every other shortcut alone.
+
+    Returns whether we changed shortcuts.vdf.
+
+    apply_library_changes(Namespace, SteamDatabase, SteamAccount, list[GameDefinition], list[GameDefinition], BackupStore) -> bool
+    """
+    # Steam may have changed the file since we last looked.
     shortcut_file_path = user.get_shortcut_filepath(steamdb._steam_path)
     shortcuts = _load_shortcuts(shortcut_file_path, args.init_shortcuts_file)
     if not shortcuts:
-        return 1
+        return False
+    shortcut_index = shortcuts_vdf.ShortcutIndex(shortcuts)
+
+    dropped = set()
+    for game in removed:
+        i = shortcut_index.find_by_key(*game.get_launcher(args.use_uri))
+        if i:
+            print(f"Removing '{game.display_name}'. It was uninstalled.")
+            dropped.add(i)
+    if dropped:
+        shortcut_index.keep_only(
+            [v for k, v in shortcut_index.get_shortcuts().items() if k not in dropped]
+        )
+
+    result = None
+    if added:
+        result, msg = add_games_to_shortcut_file(
+            steamdb,
+            user,
+            added,
+            shortcut_index,
+            args.use_uri,
+            args.replace_existing,
+            download_art_unsupported=False,
+        )
+
+    if not dropped and result is None:
+        return False
+    if not write_shortcuts(shortcut_file_path, shortcuts, backup_store):
+        return False
+
+    if args.download_art and added:
+        count = steamdb.download_art_multiple(
+            user, added, should_replace_existing=False
+        )
+        print(f"Downloaded new art for {count} games.")
+    return True
+
+
+def watch_for_changes(args, steamdb, users, launchers, commands, games):
+    """Update shortcuts whenever a store's library changes, until the user
+    presses Ctrl+C.
+
+    Only the store that changed is rescanned, and only games it added or
+    removed since the last scan are applied.
+
+    watch_for_changes(Namespace, SteamDatabase, list[SteamAccount], dict, CommandRunner, list[GameDefinition]) -> None
+    """
+    watched = {}
+    for tag, l in launchers.items():
+        if l.is_installed() and l.get_watch_paths():
+            watched[tag] = l
+        else:
+            print(
+                f"Can't watch {l.get_display_name()} for changes. Restart steamsync to collect its new games."
+            )
+    if not watched:
+        return
+
+    known = {tag: {} for tag in watched}
+    for game in games:
+        if game.storetag in known:
+            known[game.storetag][game.get_launcher(args.use_uri)] = game
+
+    backup_stores = {}
+    for user in users:
+        backup_stores[user.steamid] = None
+        if not args.live_dangerously:
+            backup_stores[user.steamid] = _get_backup_store(
+                user, user.get_shortcut_filepath(steamdb._steam_path)
+            )
+
+    watcher = watch.create_watcher()
+    try:
+        watcher.set_paths({tag: l.get_watch_paths() for tag, l in watched.items()})
+        while True:
+            names = ", ".join(l.get_display_name() for l in watched.values())
+            print(f"\nWatching {names} for changes. Press Ctrl+C to stop.")
+            changed = watcher.wait_for_changes()
+
+            fsprobe.get_probe().clear()
+            found, collected = collect_all_games(
+                args, {tag: watched[tag] for tag in changed}, commands
+            )
+            added = []
+            removed = []
+            for tag in collected:
+                current = _get_game_keys(
+                    [g for g in found if g.storetag == tag], args.use_uri
+                )
+                added += [g for k, g in current.items() if k not in known[tag]]
+                if args.remove_missing:
+                    removed += [g for k, g in known[tag].items() if k not in current]
+                known[tag] = current
+
+            # Rescans can find new things to watch (like new itch games).
+            # Paths we were already watching keep their watches, so changes
+            # that happened while we rescanned are seen next time around.
+            watcher.set_paths({tag: l.get_watch_paths() for tag, l in watched.items()})
+
+            print(f"Found {len(added)} new games and {len(removed)} uninstalled games")
+            for user in users:
+                user_added = [copy.copy(g) for g in added]
+                backup_store = backup_stores[user.steamid]
+                if apply_library_changes(
+                    args, steamdb, user, user_added, removed, backup_store
+                ):
+                    print(
+                        f"Wrote `shortcuts.vdf` for {user.username} successfully! Restart Steam!"
+                    )
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
+
+
+def _get_sync_fingerprint(steamdb, user, sync_inputs):
+    """Fingerprint a sync of sync_inputs to the user's current files.
+
+    _get_sync_fingerprint(SteamDatabase, SteamAccount, list) -> str
+    """
+    outputs = fingerprint.get_outputs(user, steamdb._steam_path)
+    return fingerprint.compute(sync_inputs, outputs)
+
+
+def _copy_games_for_user(all_games, games):
+    """Copy GameDefinitions so the shortcut ids we find in one user's
+    shortcuts.vdf don't leak into another user's.
+
+    _copy_games_for_user(list[GameDefinition], list[GameDefinition]) -> list[GameDefinition], list[GameDefinition]
+    """
+    copies = {id(game): copy.copy(game) for game in all_games}
+    selected = [copies[id(game)] for game in games]
+    return list(copies.values()), selected
+
+
+def sync_user(args, steamdb, user, shortcuts, all_games, games):
+    """Install shortcuts (and art) for the selected games to one user.
+
+    sync_user(Namespace, SteamDatabase, SteamAccount, dict, list[GameDefinition], list[GameDefinition]) -> None
+    """
+    print(f"\nInstalling shortcuts for SteamID {user.username} `{user.steamid}`")
+
+    shortcut_file_path = user.get_shortcut_filepath(steamdb._steam_path)
+    shortcut_index = shortcuts_vdf.ShortcutIndex(shortcuts)
 
     should_write_vdf = False
     if args.remove_missing:
@@ -661,7 +1024,7 @@ def main():
             steamdb,
             user,
             all_games,
-            shortcuts,
+            shortcut_index,
         )
         should_write_vdf |= result is not None
 
@@ -669,7 +1032,7 @@ def main():
         steamdb,
         user,
         games,
-        shortcuts,
+        shortcut_index,
         args.use_uri,
         args.replace_existing,
         args.download_art_all_shortcuts,
@@ -690,37 +1053,176 @@ def main():
             # We don't have an argument for replacing art and replacing
             # shortcuts is pretty different, so explain the better path.
             print(
-                f"To replace existing art, delete the images in {user.get_grid_folder(steamdb._steam_path)}"
+                f"To replace existing art, delete the images in {user.get_grid_folder(steamdb._steam_path)} and the art steamsync keeps in {steamdb.get_art_store_folder()}"
             )
         count = steamdb.download_art_multiple(
             user, get_art_for_games, should_replace_existing=False
         )
         print(f"Downloaded new art for {count} games.")
+        if not steamdb.has_loaded_app_list():
+            print("Skipped loading the Steam app list. No games needed an appid.")
         print()
 
     if should_write_vdf:
         print()
-        if args.live_dangerously:
-            print("Not backing up `shortcuts.vdf` since you enjoy danger")
-            os.remove(shortcut_file_path)
-        elif os.path.exists(shortcut_file_path):
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            new_filename = shortcut_file_path + f"-{timestamp}.bak"
+        backup_store = None
+        if not args.live_dangerously:
+            backup_store = _get_backup_store(user, shortcut_file_path)
+        if write_shortcuts(shortcut_file_path, shortcuts, backup_store):
+            print("Wrote `shortcuts.vdf` successfully!")
+            print()
+            print("➡   Restart Steam!")
+
+
+def main():
+    args = parse_arguments()
+
+
+    steamdb = steameditor.SteamDatabase(
+        args.steam_path,
+        args.steam_api_key,
+        args.download_art or args.download_art_all_shortcuts,
+        appdirs.user_cache_dir("steamsync"),
+        args.use_uri,
+        args.art_download_workers,
+        args.fuzzy_match_threshold,
+    )
+
+    if args.watch and not args.all:
+        print("--watch adds every game it finds, so it needs --all too.")
+        return 1
 
-            print(f"Backing up `shortcuts.vdf` to `{new_filename}`")
-            os.rename(shortcut_file_path, new_filename)
+    if args.all_accounts and args.steamid:
+        print("Use either --steamid or --all-accounts, not both.")
+        return 1
 
-        new_bytes = vdf.binary_dumps(shortcuts)
-        with open(shortcut_file_path, "wb") as shortcut_file:
-            shortcut_file.write(new_bytes)
+    if args.dump_shortcut_vdf:
+        # Do this early to avoid showing game list.
+        user = get_steam_user(steamdb, args.steam_path, args.steamid)
+        shortcut_file_path = user.get_shortcut_filepath(steamdb._steam_path)
+        shortcuts = _load_shortcuts(shortcut_file_path, args.init_shortcuts_file)
+        print("Contents of", shortcut_file_path)
+        pprint.pprint(shortcuts)
+        return 0
 
-        print("Wrote `shortcuts.vdf` successfully!")
+    if args.list_backups or args.restore_backup:
+        user = get_steam_user(steamdb, args.steam_path, args.steamid)
+        shortcut_file_path = user.get_shortcut_filepath(steamdb._steam_path)
+        # Don't move .bak files in until we save shortcuts, like the README
+        # says.
+        backup_store = backups.BackupStore(backups.get_default_folder(user.steamid))
+        if args.list_backups:
+            print_backups(backup_store, shortcut_file_path)
+            return 0
+        backup = backup_store.find(args.restore_backup)
+        if not backup:
+            print(f"No single backup matches '{args.restore_backup}'")
+            print_backups(backup_store, shortcut_file_path)
+            return 1
+        backup_store.restore(backup, shortcut_file_path)
+        print(f"Restored `shortcuts.vdf` from {backup.get_time():%Y-%m-%d %H:%M:%S}")
         print()
         print("➡   Restart Steam!")
+        return 0
+
+    cache_folder = appdirs.user_cache_dir("steamsync")
+    commands = runner.CommandRunner(args.command_timeout, cache_folder)
+    launchers = create_launchers(args, commands)
+
+    # Scheduled --all runs rarely have anything to do, so check that before
+    # collecting games.
+    users = None
+    sync_inputs = None
+    if args.all and not args.watch:
+        users = get_steam_users(steamdb, args)
+        sync_inputs = fingerprint.get_inputs(args, launchers)
+        if sync_inputs is not None and not args.force:
+            if all(
+                fingerprint.load_last(cache_folder, user.steamid)
+                == _get_sync_fingerprint(steamdb, user, sync_inputs)
+                for user in users
+            ):
+                print("Nothing changed since the last sync. --force syncs anyway.")
+                return 0
+
+    # 1. Collect all games from every enabled store
+    all_games, collected = collect_all_games(args, launchers, commands)
+
+    # 2. Print out the list of games we got
+    print_games(all_games, args.use_uri)
+
+    # 3. Have the user select the games they want
+    games = all_games
+
+    if not args.all:
+        picks = None
+        while not picks:
+            picks = filter_games(games)
+            if picks is False:
+                print("Quitting...")
+                return 0
+
+        games = picks
+
+    # 4. Pick the accounts to add shortcuts to (if needed)
+    if not users:
+        users = get_steam_users(steamdb, args)
+
+    # 5. Write shortcuts to steam!
+
+    # Loading shortcuts is mostly waiting on the disk, so load every user's
+    # at once.
+    with ThreadPoolExecutor(max_workers=max(1, len(users))) as pool:
+        all_shortcuts = list(
+            pool.map(
+                lambda user: _load_shortcuts(
+                    user.get_shortcut_filepath(steamdb._steam_path),
+                    args.init_shortcuts_file,
+                ),
+                users,
+            )
+        )
+
+    synced_users = []
+    for user, shortcuts in zip(users, all_shortcuts):
+        if not shortcuts:
+            continue
+        # Reconciling prints as it goes and mostly holds the GIL, so users
+        # are reconciled one at a time. Exe checks and art downloads from
+        # earlier users are reused.
+        user_all_games, user_games = _copy_games_for_user(all_games, games)
+        sync_user(args, steamdb, user, shortcuts, user_all_games, user_games)
+        synced_users.append(user)
+    if not synced_users:
+        return 1
+
+    installed = {tag for tag, l in launchers.items() if l.is_installed()}
+    if sync_inputs is not None and steamdb.get_failed_art_count():
+        # Forget the last sync so the next run tries again, even if nothing
+        # else changes.
+        print("Some art failed to download. The next sync will try again.")
+        for user in synced_users:
+            fingerprint.save(cache_folder, user.steamid, None)
+    elif sync_inputs is not None and collected == installed:
+        # Fingerprint the files after we changed them, so the next run
+        # knows we're up to date.
+        for user in synced_users:
+            fingerprint.save(
+                cache_folder,
+                user.steamid,
+                _get_sync_fingerprint(steamdb, user, sync_inputs),
+            )
+
+    if args.watch:
+        watch_for_changes(args, steamdb, synced_users, launchers, commands, all_games)
 
-    print("\nDone.")
+    print(f"\nChecked game files with {fsprobe.get_probe().get_stats()}.")
+    print("Done.")
     return 0
 
 
 if __name__ == "__main__":
+    # The app list is indexed on worker processes, which need this when we're
+    # frozen into an exe by pyinstaller.
+    multiprocessing.freeze_support()
     main()
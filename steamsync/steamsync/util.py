@@ -1,7 +1,14 @@
 #! /usr/bin/env python
 # LICENSE: AGPLv3. See LICENSE at root of repo
 
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import steamsync.fsprobe as fsprobe
 
 
 def is_executable_game(game_path):
@@ -10,6 +17,88 @@ def is_executable_game(game_path):
     is_executable_game(Path) -> bool
     """
     try:
-        return game_path.is_file() and os.access(game_path, os.R_OK)
+        return fsprobe.get_probe().is_readable_file(game_path)
     except OSError:
         return False
+
+
+def _get_umask():
+    # There's no way to read the umask without setting it, so only do this
+    # once before we start any threads.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_umask = _get_umask()
+
+
+def atomic_write_bytes(path, data):
+    """Write data to path so that readers see either the old or new file, but
+    never a partial one.
+
+    atomic_write_bytes(Path, bytes) -> None
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp only lets us read and write it, but we're replacing a file
+        # others may need to access.
+        if path.exists():
+            shutil.copymode(path, tmp_name)
+        else:
+            os.chmod(tmp_name, 0o666 & ~_umask)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def hash_file(path):
+    """Get the sha256 of a file's contents, or None if it doesn't exist.
+
+    hash_file(Path) -> str
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def load_json_cache(path, version):
+    """Load a cache file written by save_json_cache.
+
+    Returns an empty dict if the file is missing, unreadable, or from a
+    different version of steamsync.
+
+    load_json_cache(Path, int) -> dict
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != version:
+        return {}
+    return data.get("entries", {})
+
+
+def save_json_cache(path, version, entries):
+    """Save a dict of cache entries as json.
+
+    save_json_cache(Path, int, dict) -> None
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = json.dumps({"version": version, "entries": entries})
+    atomic_write_bytes(path, data.encode("utf-8"))
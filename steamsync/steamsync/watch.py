@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Wait for store libraries to change, for --watch.
+
+On Linux we ask inotify to wake us when something changes. Elsewhere (or if
+inotify isn't available) we poll the watched files every few seconds.
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import time
+
+k_settle_seconds = 2
+k_poll_interval = 5
+
+# From sys/inotify.h
+k_in_close_write = 0x00000008
+k_in_moved_from = 0x00000040
+k_in_moved_to = 0x00000080
+k_in_create = 0x00000100
+k_in_delete = 0x00000200
+k_in_delete_self = 0x00000400
+k_in_move_self = 0x00000800
+k_in_q_overflow = 0x00004000
+k_in_ignored = 0x00008000
+k_in_onlydir = 0x01000000
+k_in_nonblock = 0o4000
+k_in_cloexec = 0o2000000
+k_watch_mask = (
+    k_in_close_write
+    | k_in_moved_from
+    | k_in_moved_to
+    | k_in_create
+    | k_in_delete
+    | k_in_delete_self
+    | k_in_move_self
+    | k_in_onlydir
+)
+k_event_header = struct.Struct("iIII")
+
+
+class Watcher(abc.ABC):
+    """
+    Waits for any of a set of files or folders to change
+
+    Paths are grouped under keys (like store ids) so callers know which
+    group changed.
+    """
+
+    @abc.abstractmethod
+    def set_paths(self, paths_by_key):
+        """Replace what we're watching.
+
+        Watching a folder notices files added to, removed from, or written
+        in it. Watching a file notices it being written, replaced, or
+        deleted. Paths we were already watching keep watching from where
+        they were, so changes made since we last waited aren't missed.
+
+        set_paths(dict[str, list[Path]]) -> None
+        """
+
+    @abc.abstractmethod
+    def _wait(self, timeout):
+        """Wait for changes for up to timeout seconds (None for forever).
+
+        _wait(float) -> set[str]
+        """
+
+    def wait_for_changes(self, settle=k_settle_seconds):
+        """Block until something changes and then stays quiet for settle
+        seconds, so we don't rescan halfway through an install.
+
+        Returns the keys of the paths that changed.
+
+        wait_for_changes(float) -> set[str]
+        """
+        changed = set()
+        while not changed:
+            changed = self._wait(None)
+        while True:
+            more = self._wait(settle)
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(Watcher):
+    """
+    Notices changes by comparing listings and stats of every path
+    """
+
+    def __init__(self, interval=k_poll_interval):
+        self.interval = interval
+        self._snapshot = {}
+
+    def set_paths(self, paths_by_key):
+        snapshot = {}
+        for key, paths in paths_by_key.items():
+            old = self._snapshot.get(key, {})
+            signatures = {}
+            for p in paths:
+                path = os.fspath(p)
+                signatures[path] = old[path] if path in old else _get_signature(p)
+            snapshot[key] = signatures
+        self._snapshot = snapshot
+
+    def _poll(self):
+        changed = set()
+        for key, signatures in self._snapshot.items():
+            for path, old in signatures.items():
+                new = _get_signature(path)
+                if new != old:
+                    signatures[path] = new
+                    changed.add(key)
+        return changed
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0, deadline - time.monotonic()))
+            time.sleep(delay)
+            changed = self._poll()
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+def _get_signature(path):
+    """Get something that changes whenever path or (for folders) the files
+    directly inside it change.
+
+    _get_signature(Path) -> tuple
+    """
+    try:
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            return (st.st_size, st.st_mtime_ns)
+        signature = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                entry_stat = entry.stat()
+                signature.append(
+                    (entry.name, entry_stat.st_size, entry_stat.st_mtime_ns)
+                )
+        return tuple(sorted(signature))
+    except OSError:
+        return None
+
+
+class InotifyWatcher(Watcher):
+    """
+    Sleeps until Linux tells us something changed
+
+    inotify watches folders, so files are watched through their folder and
+    events for other files in it are ignored.
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError(errno.ENOSYS, "Can't find libc")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(k_in_nonblock | k_in_cloexec)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        # watch descriptor -> list of (key, file name or None for any file)
+        self._watches = {}
+        # folder -> watch descriptor
+        self._folders = {}
+
+    def set_paths(self, paths_by_key):
+        wanted = {}
+        for key, paths in paths_by_key.items():
+            for path in paths:
+                path = os.path.abspath(path)
+                if os.path.isdir(path):
+                    folder, name = path, None
+                else:
+                    folder, name = os.path.split(path)
+                wanted.setdefault(folder, []).append((key, name))
+
+        # Removing and adding a watch again would drop events that arrived
+        # in between, so only touch folders that came or went.
+        watches = {}
+        for folder, targets in wanted.items():
+            wd = self._folders.get(folder)
+            if wd is None:
+                wd = self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(folder), k_watch_mask
+                )
+                if wd < 0:
+                    # Missing folders have nothing to install into, so
+                    # there's nothing to watch until the next rescan.
+                    continue
+                self._folders[folder] = wd
+            watches.setdefault(wd, []).extend(targets)
+        for folder in [f for f in self._folders if f not in wanted]:
+            wd = self._folders.pop(folder)
+            if wd not in watches:
+                self._libc.inotify_rm_watch(self._fd, wd)
+        self._watches = watches
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return set()
+            # Events for files we don't care about (or for watches we
+            # removed) aren't changes, so keep waiting.
+            changed = self._read_events()
+            if changed:
+                return changed
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = k_event_header.unpack_from(data, offset)
+            offset += k_event_header.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & k_in_q_overflow:
+                # We missed events, so anything could have changed.
+                changed.update(key for w in self._watches.values() for key, _ in w)
+                continue
+            for key, want in self._watches.get(wd, []):
+                if (
+                    want is None
+                    or mask & (k_in_delete_self | k_in_move_self | k_in_ignored)
+                    or os.fsdecode(name) == want
+                ):
+                    changed.add(key)
+            if mask & k_in_ignored:
+                # The folder is gone, so watch it again if it comes back.
+                self._watches.pop(wd, None)
+                self._folders = {f: w for f, w in self._folders.items() if w != wd}
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher():
+    """Create the best watcher for this platform.
+
+    create_watcher() -> Watcher
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print(f"Can't use inotify ({e}), polling for changes instead")
+    return PollingWatcher()
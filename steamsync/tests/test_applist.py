@@ -0,0 +1,348 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Check AppList against the old chain of guesses and a stand-in for Steam.
+
+Run with pytest, or directly with python -m tests.test_applist
+"""
+
+import http.server
+import json
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import urllib.parse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+
+from steamsync.applist import (
+    AppList,
+    AppListSyncError,
+    _fetch_apps,
+    _is_demo,
+    k_applist_db_fname,
+    make_gamename_comparable,
+    re_remove_braces,
+    re_remove_pc,
+    re_remove_subtitle,
+)
+
+# Steam names and store names for them that lookup needs to match the same
+# way the old chain of guesses in SteamDatabase.guess_appid did.
+_regression_catalogue = [
+    (3970, "Prey"),
+    (271590, "Grand Theft Auto V"),
+    (292030, "The Witcher 3: Wild Hunt"),
+    (322170, "Geometry Dash"),
+    (387290, "Ori and the Blind Forest: Definitive Edition"),
+    (480490, "Prey"),
+    (504230, "Celeste"),
+    (590380, "Into the Breach"),
+    (736260, "Baba Is You"),
+    (834530, "Yakuza Kiwami"),
+    (870780, "Control Ultimate Edition"),
+    (894020, "Death's Door"),
+    (894040, "Death's Door Demo"),
+    (972660, "Spiritfarer®: Farewell Edition"),
+    (976730, "Halo: The Master Chief Collection"),
+    (1057090, "Ori and the Will of the Wisps"),
+    (1085660, "Destiny 2"),
+    (1091500, "Cyberpunk 2077"),
+    (1145360, "Hades"),
+    (1150950, "Raji: An Ancient Epic"),
+    (1177980, "Genesis Noir"),
+    (1182900, "A Short Hike"),
+    (252950, "Rocket League"),
+    (384190, "ABZÛ"),
+    (529540, "Ghost of a Tale"),
+    (1172470, "Apex Legends™"),
+    (1240440, "Halo Infinite"),
+    (1293830, "Forza Horizon 4"),
+    (1551360, "Forza Horizon 5"),
+    (1237320, "Sonic Frontiers"),
+    (548430, "Deep Rock Galactic"),
+    (1222670, "The Sims™ 4"),
+    (1623730, "Palworld"),
+    (1245620, "ELDEN RING"),
+    (1604030, "V Rising"),
+    (1313140, "Cult of the Lamb"),
+    (1966720, "Lethal Company"),
+    (413150, "Stardew Valley"),
+    (105600, "Terraria"),
+    (1794680, "Vampire Survivors"),
+    (1868140, "DAVE THE DIVER"),
+    (367520, "Hollow Knight"),
+    (2379780, "Balatro"),
+]
+_regression_queries = [
+    "Prey",
+    "Control",
+    "Death's Door Win10",
+    "Yakuza Kiwami (PC)",
+    "Ghost of a Tale PC",
+    "Genesis Noir for Windows",
+    "Grand Theft Auto V: Premium Edition",
+    "Raji: An Ancient Epic",
+    "Raji An Ancient Epic",
+    "ABZÛ",
+    "ABZU",
+    "Rocket League®",
+    "Into The Breach",
+    "Spiritfarer®: Farewell Edition",
+    "Halo: The Master Chief Collection",
+    "Halo Infinite (Campaign)",
+    "Forza Horizon 4 Standard Edition",
+    "Forza Horizon 5",
+    "Celeste",
+    "Hades",
+    "A Short Hike",
+    "Baba Is You",
+    "Ori and the Blind Forest",
+    "Ori and the Will of the Wisps",
+    "Destiny 2: Legacy Collection",
+    "Cyberpunk 2077",
+    "The Witcher 3: Wild Hunt",
+    "Apex Legends™",
+    "The Sims 4",
+    "Deep Rock Galactic",
+    "Palworld",
+    "ELDEN RING",
+    "V Rising",
+    "Cult of the Lamb",
+    "Lethal Company",
+    "Stardew Valley",
+    "Terraria",
+    "Vampire Survivors",
+    "DAVE THE DIVER",
+    "Hollow Knight",
+    "Balatro",
+    "Sonic Frontiers",
+    "Geometry Dash",
+    "Not a real game",
+]
+# Names the old chain missed even though it meant to find them. For example,
+# "Grand Theft Auto V" was never in stripped_to_id because it's already in
+# name_to_id.
+_regression_new_matches = {
+    "Grand Theft Auto V: Premium Edition": 271590,
+    "Destiny 2: Legacy Collection": 1085660,
+}
+
+
+def _guess_appid_like_before(name_to_id, stripped_to_id, name):
+    """The chain of guesses guess_appid used before the canonical key, to
+    check lookup still agrees with it.
+
+    _guess_appid_like_before(dict, dict, str) -> int
+    """
+    name = make_gamename_comparable(name)
+    appid = name_to_id.get(name)
+    if not appid:
+        for suffix in [" ultimate edition", " digital edition", " steam edition"]:
+            appid = name_to_id.get(name + suffix)
+            if appid:
+                break
+    if not appid:
+        appid = name_to_id.get(re.sub(r" win10\b", "", name, 1))
+    if not appid:
+        appid = name_to_id.get(re_remove_braces.sub("", name, 1))
+    if not appid:
+        appid = name_to_id.get(re_remove_pc.sub("", name, 1))
+    if not appid:
+        appid = stripped_to_id.get(re_remove_subtitle.sub("", name, 1))
+    if not appid:
+        stripped = re.sub(r"[:;,.=+?]", "", name)
+        appid = name_to_id.get(stripped) or stripped_to_id.get(stripped)
+    if not appid:
+        name = "".join(
+            c
+            for c in unicodedata.normalize("NFKD", name)
+            if not unicodedata.combining(c)
+        )
+        appid = name_to_id.get(name) or stripped_to_id.get(name)
+    if not appid:
+        appid = name_to_id.get(name.encode("ascii", "ignore").decode().strip())
+    return appid
+
+
+def test_lookup_matches_old_guesses():
+    """Check lookup finds everything the old chain of guesses found."""
+    name_to_id = {}
+    stripped_to_id = {}
+    for appid, name in _regression_catalogue:
+        name = make_gamename_comparable(name)
+        name_to_id[name] = appid
+        if not _is_demo(name):
+            for stripped in [
+                "".join(
+                    c
+                    for c in unicodedata.normalize("NFKD", name)
+                    if not unicodedata.combining(c)
+                ),
+                re.sub(r"[:;,.=+?]", "", name),
+                re_remove_subtitle.sub("", name, 1),
+            ]:
+                if stripped not in name_to_id:
+                    stripped_to_id[stripped] = appid
+
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = AppList(Path(tmp) / k_applist_db_fname)
+        apps._store(_regression_catalogue, datetime.utcnow(), rebuild=True)
+        found = {query: apps.lookup(query) for query in _regression_queries}
+        apps.close()
+
+    for query, actual in found.items():
+        expected = _guess_appid_like_before(name_to_id, stripped_to_id, query)
+        if not expected:
+            expected = _regression_new_matches.get(query)
+        assert actual == expected, (query, actual, expected)
+
+
+def test_sync():
+    """Sync against a local stand-in for GetAppList and check the results."""
+    catalogue = {
+        i: {"appid": i, "name": f"Game {i}", "last_modified": 100} for i in range(1, 8)
+    }
+    catalogue[3]["name"] = "Raji: An Ancient Epic"
+    page_size = 3
+    requests_seen = []
+
+    class FakeSteam(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            requests_seen.append(query)
+            last_appid = int(query.get("last_appid", ["0"])[0])
+            since = int(query.get("if_modified_since", ["0"])[0])
+            apps = [
+                {"appid": a["appid"], "name": a["name"]}
+                for appid, a in sorted(catalogue.items())
+                if appid > last_appid and a["last_modified"] > since
+            ]
+            response = {"apps": apps[:page_size]}
+            if len(apps) > page_size:
+                response["have_more_results"] = True
+                response["last_appid"] = apps[page_size - 1]["appid"]
+            body = json.dumps({"response": response}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeSteam)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = AppList(Path(tmp) / k_applist_db_fname)
+        session = requests.Session()
+
+        apps.sync(session, "key", url)
+        assert len(requests_seen) == 3, requests_seen
+        assert apps.lookup("Game 7") == 7
+        assert apps.lookup("Raji") == 3
+        assert apps.find_similar("Raji - Ancient Epic", 0.7)[0] == 3
+        assert apps.find_similar("Something Else", 0.7)[0] is None
+
+        # Fresh list doesn't talk to steam.
+        apps.sync(session, "key", url)
+        assert len(requests_seen) == 3
+
+        # Pretend a day went by, and one app was renamed and one added.
+        with apps._db:
+            apps._db.execute(
+                "UPDATE meta SET value = ? WHERE key = 'download_timestamp'",
+                ((datetime.utcnow() - timedelta(days=2)).isoformat(),),
+            )
+        now = int(time.time())
+        catalogue[2].update(name="Renamed", last_modified=now)
+        catalogue[8] = {"appid": 8, "name": "Game 8", "last_modified": now}
+        apps.sync(session, "key", url)
+        assert "if_modified_since" in requests_seen[-1]
+        assert apps.lookup("Game 2") is None
+        assert apps.lookup("Renamed") == 2
+        assert apps.lookup("Game 8") == 8
+        assert apps.lookup("Game 7") == 7
+        assert apps.find_similar("Renamed!", 0.7)[0] == 2
+        assert apps.find_similar("Game 2", 0.9)[0] is None
+        apps.close()
+
+    server.shutdown()
+
+
+def test_fetch_apps_without_last_appid():
+    """A page that says there's more but not where to continue is an error
+    sync can recover from, not a crash."""
+
+    class FakeResponse:
+        status_code = 200
+
+        def json(self):
+            apps = [{"appid": 1, "name": "Game 1"}]
+            return {"response": {"apps": apps, "have_more_results": True}}
+
+    class FakeSession:
+        def get(self, *args, **kwargs):
+            return FakeResponse()
+
+    try:
+        _fetch_apps(FakeSession(), "http://127.0.0.1/", "key")
+    except AppListSyncError:
+        pass
+    else:
+        assert False, "Expected AppListSyncError"
+
+
+def test_migrate_from_json():
+    """Import the applist.json older versions wrote without downloading
+    the list again."""
+
+    class OfflineSession:
+        def get(self, *args, **kwargs):
+            raise AssertionError("Shouldn't download a freshly imported list")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "applist.json"
+        apps = AppList(Path(tmp) / k_applist_db_fname)
+
+        json_path.write_text(
+            json.dumps(
+                {
+                    "version": 3,
+                    "download_timestamp": datetime.utcnow().isoformat(),
+                    "name_to_id": {
+                        "raji: an ancient epic": 1150950,
+                        "hades": 1145360,
+                    },
+                }
+            ),
+            encoding="utf-8",
+        )
+        assert apps.migrate_from_json(json_path)
+        assert not json_path.exists()
+        apps.sync(OfflineSession(), "key")
+        assert apps.lookup("Raji: An Ancient Epic") == 1150950
+        assert apps.lookup("Hades") == 1145360
+
+        # Broken files are dropped like unreadable ones.
+        json_path.write_text(
+            json.dumps({"version": 3, "name_to_id": {"celeste": 504230}}),
+            encoding="utf-8",
+        )
+        assert not apps.migrate_from_json(json_path)
+        assert not json_path.exists()
+        assert apps.lookup("Hades") == 1145360
+        apps.close()
+
+
+if __name__ == "__main__":
+    test_lookup_matches_old_guesses()
+    test_sync()
+    test_fetch_apps_without_last_appid()
+    test_migrate_from_json()
@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Check the art store never breaks art it put in grid folders.
+
+Run with pytest, or directly with python -m tests.test_artstore
+"""
+
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from steamsync import artstore
+from steamsync.artstore import ArtStore
+
+
+def _add(store, key, data):
+    return store.add(key, f"https://example.com/{key}.png", [data], ".png", {})
+
+
+def test_prune_keeps_used_images():
+    with tempfile.TemporaryDirectory() as tmp:
+        grid = Path(tmp) / "grid"
+        grid.mkdir()
+        store = ArtStore(Path(tmp) / "art")
+        hero = _add(store, "440:hero", b"hero v1")
+        logo = _add(store, "440:logo", b"logo")
+        store.copy_to(hero, grid / "1_hero.png")
+        store.copy_to(logo, grid / "1_logo.png")
+
+        # Updated art replaces the old image in the store.
+        new_hero = _add(store, "440:hero", b"hero v2")
+        store.save()
+
+        assert not store.get_path(hero).exists()
+        assert store.get_path(new_hero).read_bytes() == b"hero v2"
+        assert store.get_path(logo).read_bytes() == b"logo"
+        # Art already in the grid is untouched.
+        assert (grid / "1_hero.png").read_bytes() == b"hero v1"
+        assert (grid / "1_logo.png").read_bytes() == b"logo"
+
+        # A new store on the same folder reads back what we saved.
+        store = ArtStore(Path(tmp) / "art")
+        assert store.get("440:logo", logo["url"]) == logo
+
+
+def test_grid_copies_are_independent():
+    with tempfile.TemporaryDirectory() as tmp:
+        grid = Path(tmp) / "grid"
+        grid.mkdir()
+        store = ArtStore(Path(tmp) / "art")
+        entry = _add(store, "440:hero", b"hero")
+        dest = grid / "1_hero.png"
+        store.copy_to(entry, dest)
+
+        assert not dest.is_symlink()
+        assert dest.stat().st_ino != store.get_path(entry).stat().st_ino
+        # Custom art edited in place doesn't change what we stored.
+        dest.write_bytes(b"custom")
+        assert store.get_path(entry).read_bytes() == b"hero"
+
+
+def test_prune_interrupted_downloads():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ArtStore(Path(tmp) / "art")
+        _add(store, "440:hero", b"hero")
+        objects = Path(tmp) / "art" / "objects"
+        stale = objects / "stale.part"
+        stale.write_bytes(b"stale")
+        old = time.time() - artstore.k_stale_part_seconds - 60
+        os.utime(stale, (old, old))
+        fresh = objects / "fresh.part"
+        fresh.write_bytes(b"still downloading")
+
+        store.save()
+        assert not stale.exists()
+        assert fresh.exists()
+
+
+if __name__ == "__main__":
+    test_prune_keeps_used_images()
+    test_grid_copies_are_independent()
+    test_prune_interrupted_downloads()
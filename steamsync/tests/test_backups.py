@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Check which shortcuts.vdf backups we keep and that restoring them works.
+
+Run with pytest, or directly with python -m tests.test_backups
+"""
+
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from steamsync import backups
+from steamsync.backups import BackupStore
+
+# Backups made at these (local) times, oldest first. Mar 16-18 2026 are in
+# ISO week 12, Mar 9-10 in week 11 and Mar 2 in week 10.
+_retention_times = {
+    "h": datetime(2026, 3, 2, 12),
+    "g": datetime(2026, 3, 9, 12),
+    "f": datetime(2026, 3, 10, 12),
+    "e": datetime(2026, 3, 16, 9),
+    "d": datetime(2026, 3, 17, 12),
+    "c": datetime(2026, 3, 18, 10),
+    "b": datetime(2026, 3, 18, 11),
+    "a": datetime(2026, 3, 18, 12),
+}
+
+
+def test_retention():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BackupStore(tmp, keep_last=2, keep_daily=2, keep_weekly=2)
+        for name, when in _retention_times.items():
+            assert store.add(name.encode(), when.timestamp())
+
+        # The last 2, the last of the newest 2 days (Mar 18 and 17) and the
+        # last of the newest 2 weeks (12 and 11).
+        kept = [store.read(b) for b in BackupStore(tmp).list_backups()]
+        assert kept == [b"a", b"b", b"d", b"f"]
+        assert len(list(Path(tmp).glob("*.vdf.gz"))) == 4
+
+
+def test_unchanged_isnt_backed_up():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BackupStore(tmp)
+        assert store.add(b"same", 100)
+        assert store.add(b"same", 200) is None
+        assert store.add(b"other", 300)
+        # Content we already have is stored once.
+        assert store.add(b"same", 400)
+        assert len(store.list_backups()) == 3
+        assert len(list(Path(tmp).glob("*.vdf.gz"))) == 2
+
+
+def test_restore():
+    with tempfile.TemporaryDirectory() as tmp:
+        shortcut_file_path = os.path.join(tmp, "shortcuts.vdf")
+        store = BackupStore(Path(tmp) / "backups")
+        original = bytes(range(256)) * 4
+        store.add(original, 100)
+        with open(shortcut_file_path, "wb") as f:
+            f.write(b"current")
+
+        backup = store.find("1")
+        assert backup is store.find(backup.sha256[:8])
+        store.restore(backup, shortcut_file_path)
+        with open(shortcut_file_path, "rb") as f:
+            assert f.read() == original
+
+        # The file we replaced is the newest backup, so restoring can be
+        # undone.
+        assert store.read(store.find("1")) == b"current"
+
+
+def test_migrated_bak_files_are_kept():
+    with tempfile.TemporaryDirectory() as tmp:
+        shortcut_file_path = os.path.join(tmp, "shortcuts.vdf")
+        for name, when in _retention_times.items():
+            stamp = time.strftime(backups.k_bak_time_format, when.timetuple())
+            with open(f"{shortcut_file_path}-{stamp}.bak", "wb") as f:
+                f.write(name.encode())
+
+        store = BackupStore(
+            Path(tmp) / "backups", keep_last=1, keep_daily=1, keep_weekly=1
+        )
+        assert store.migrate_bak_files(shortcut_file_path) == len(_retention_times)
+        assert backups.find_bak_files(shortcut_file_path) == []
+        store.add(b"new")
+
+        kept = {store.read(b) for b in BackupStore(store.folder).list_backups()}
+        assert kept == {b"new"} | {name.encode() for name in _retention_times}
+
+
+if __name__ == "__main__":
+    test_retention()
+    test_unchanged_isnt_backed_up()
+    test_restore()
+    test_migrated_bak_files_are_kept()
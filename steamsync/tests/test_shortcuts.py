@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Check our shortcuts.vdf codec reads and writes what the vdf module does.
+
+Run with pytest, or directly with python -m tests.test_shortcuts
+"""
+
+import io
+
+import vdf
+
+import steamsync.shortcuts as shortcuts
+
+
+def _make_shortcuts():
+    """Make a shortcuts file with every type of value vdf writes.
+
+    _make_shortcuts() -> dict
+    """
+    return {
+        "shortcuts": {
+            "0": {
+                "appid": -1234567890,
+                "AppName": "Spiritfarer®: Farewell Edition – Édition spéciale",
+                "Exe": '"C:\\Games\\Spiritfarer\\Spiritfarer.exe"',
+                "LaunchOptions": "",
+                "IsHidden": 0,
+                "LastPlayTime": 1700000000,
+                "tags": {"0": "steamsync", "1": "itch"},
+            },
+            "1": {
+                "appname": "Empty",
+                "Exe": "",
+                "tags": {},
+                "Scale": 0.5,
+                "Pointer": vdf.POINTER(1234),
+                "Color": vdf.COLOR(0x00FF00FF),
+                "Big": vdf.UINT_64(2**63 + 5),
+                "Negative": vdf.INT_64(-(2**40)),
+            },
+        }
+    }
+
+
+def test_matches_vdf():
+    data = vdf.binary_dumps(_make_shortcuts())
+
+    loaded = shortcuts.loads(data)
+    assert loaded == vdf.binary_loads(data)
+    assert loaded == _make_shortcuts()
+    assert shortcuts.dumps(loaded) == data
+    assert shortcuts.dumps(_make_shortcuts()) == data
+
+
+def test_file_objects():
+    data = vdf.binary_dumps(_make_shortcuts())
+    loaded = shortcuts.load(io.BytesIO(data))
+    f = io.BytesIO()
+    shortcuts.dump(loaded, f)
+    assert f.getvalue() == data
+
+
+def test_invalid_utf8_round_trips():
+    data = vdf.binary_dumps(_make_shortcuts())
+    broken = data.replace(b"Empty", b"Em\xffty")
+    assert broken != data
+    assert shortcuts.dumps(shortcuts.loads(broken)) == broken
+
+
+if __name__ == "__main__":
+    test_matches_vdf()
+    test_file_objects()
+    test_invalid_utf8_round_trips()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# LICENSE: AGPLv3. See LICENSE at root of repo
+
+"""Check shortcuts.vdf is written atomically and only when it changed.
+
+Run with pytest, or directly with python -m tests.test_write_shortcuts
+"""
+
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+import steamsync.shortcuts as shortcuts_vdf
+import steamsync.steamsync as steamsync
+import steamsync.util as util
+from steamsync.backups import BackupStore
+
+
+def _make_shortcuts(name):
+    return {"shortcuts": {"0": {"appname": name, "Exe": f"/games/{name}"}}}
+
+
+def test_atomic_write_bytes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shortcuts.vdf"
+        path.write_bytes(b"old")
+        os.chmod(path, 0o640)
+
+        util.atomic_write_bytes(path, b"new")
+        assert path.read_bytes() == b"new"
+        assert stat.S_IMODE(path.stat().st_mode) == 0o640
+        assert os.listdir(tmp) == ["shortcuts.vdf"]
+
+
+def test_atomic_write_bytes_failure_keeps_old_file():
+    real_fsync = os.fsync
+
+    def broken_fsync(fd):
+        raise OSError("disk full")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shortcuts.vdf"
+        path.write_bytes(b"old")
+        os.fsync = broken_fsync
+        try:
+            util.atomic_write_bytes(path, b"new")
+        except OSError:
+            pass
+        else:
+            assert False, "Expected the write to fail"
+        finally:
+            os.fsync = real_fsync
+        assert path.read_bytes() == b"old"
+        assert os.listdir(tmp) == ["shortcuts.vdf"]
+
+
+def test_write_shortcuts():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shortcuts.vdf"
+        old_bytes = shortcuts_vdf.dumps(_make_shortcuts("Old"))
+        path.write_bytes(old_bytes)
+        store = BackupStore(Path(tmp) / "backups")
+
+        # Same contents: no write and no backup.
+        os.utime(path, ns=(0, 0))
+        assert not steamsync.write_shortcuts(path, _make_shortcuts("Old"), store)
+        assert path.stat().st_mtime_ns == 0
+        assert store.list_backups() == []
+
+        assert steamsync.write_shortcuts(path, _make_shortcuts("New"), store)
+        assert path.read_bytes() == shortcuts_vdf.dumps(_make_shortcuts("New"))
+        (backup,) = store.list_backups()
+        assert store.read(backup) == old_bytes
+
+
+if __name__ == "__main__":
+    test_atomic_write_bytes()
+    test_atomic_write_bytes_failure_keeps_old_file()
+    test_write_shortcuts()